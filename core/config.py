@@ -2,11 +2,15 @@
 Enhanced configuration with page layout and markup support.
 """
 
-from dataclasses import dataclass, field
-from typing import Dict, Set, List, Optional, Tuple
-from enum import Enum
+from dataclasses import dataclass, field, replace
+from typing import Dict, FrozenSet, Set, List, Mapping, Optional, Tuple
+from enum import Enum, IntEnum
+from functools import lru_cache
+from types import MappingProxyType
 import re
 
+import numpy as np
+
 class TextAlignment(Enum):
     LEFT = "left"
     CENTER = "center"
@@ -17,7 +21,16 @@ class PageType(Enum):
     ODD = "odd"
     EVEN = "even"
 
-@dataclass
+class MarkerKind(IntEnum):
+    """Kind of control marker a parsed text block stands for"""
+    NONE = 0
+    PAGE_BREAK = 1
+    LINE_BREAK = 2
+
+# Page type by page number parity: PAGE_TYPES[page_number & 1]
+PAGE_TYPES = (PageType.EVEN, PageType.ODD)
+
+@dataclass(frozen=True, slots=True)
 class RNNConfig:
     """RNN model configuration"""
     default_bias: float = 2.0
@@ -25,8 +38,9 @@ class RNNConfig:
     lstm_size: int = 400
     output_mixture_components: int = 20
     attention_mixture_components: int = 10
+    length_bucket_span: int = 4  # Max word length difference within one sampling run
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PageMargins:
     """Page margins that can differ between odd/even pages"""
     odd_left: float = 4.0
@@ -46,7 +60,7 @@ class PageMargins:
         else:
             return (self.even_left, self.even_right, self.even_top, self.even_bottom)
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PageConfig:
     """Enhanced page configuration"""
     width_mm: float = 210.0
@@ -62,7 +76,7 @@ class PageConfig:
     def height_px(self) -> int:
         return int(self.height_mm * self.mm_to_px)
     
-@dataclass
+@dataclass(slots=True)
 class TextConfig:
     """Text rendering configuration"""
     scale: float = 0.8
@@ -77,7 +91,7 @@ class TextConfig:
     def font_width(self) -> float:
         return self.base_font_size * self.scale
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TextStyle:
     """Text styling configuration"""
     alignment: TextAlignment = TextAlignment.JUSTIFY
@@ -95,26 +109,30 @@ class TextStyle:
     def font_width(self) -> float:
         return self.font_size * self.scale
 
-    def copy(self) -> "TextStyle":
-        return TextStyle(
-            alignment=self.alignment,
-            bias=self.bias,
-            style=self.style,
-            scale=self.scale,
-            font_size=self.font_size,
-            line_spacing=self.line_spacing
-        )
-
-@dataclass
+@dataclass(slots=True)
 class DocumentConfig:
     """Enhanced document configuration"""
     num_lines: int = 32
     draw_guidelines: bool = False
     margins: PageMargins = field(default_factory=PageMargins)
     page: PageConfig = field(default_factory=PageConfig)
+    # page_type -> (margins, page, text area); margins/page are frozen, so
+    # an identity check is enough to notice when either was replaced
+    _text_area_cache: Dict[PageType, tuple] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
     
     def get_text_area(self, page_type: PageType) -> Tuple[int, int, int, int]:
         """Get text area as (x, y, width, height) for given page type"""
+        cached = self._text_area_cache.get(page_type)
+        if cached is not None and cached[0] is self.margins and cached[1] is self.page:
+            return cached[2]
+        
+        text_area = self._compute_text_area(page_type)
+        self._text_area_cache[page_type] = (self.margins, self.page, text_area)
+        return text_area
+    
+    def _compute_text_area(self, page_type: PageType) -> Tuple[int, int, int, int]:
         left, right, top, bottom = self.margins.get_margins(page_type)
         
         # Convert to pixels
@@ -149,8 +167,16 @@ PREDEFINED_STYLES = {
     'caption': TextStyle(alignment=TextAlignment.CENTER, scale=0.6, font_size=14.0, bias=1.5),
 }
 
-# Character widths and valid characters (from original config)
-CHAR_WIDTHS: Dict[str, float] = {
+@lru_cache(maxsize=256)
+def style_variant(base: TextStyle, **changes) -> TextStyle:
+    """Get ``base`` with some fields changed, sharing one instance per distinct result"""
+    if all(getattr(base, name) == value for name, value in changes.items()):
+        return base
+    return replace(base, **changes)
+
+# Character widths and valid characters (from original config).
+# Read-only: WIDTH_LUT below is derived from CHAR_WIDTHS once at import.
+CHAR_WIDTHS: Mapping[str, float] = MappingProxyType({
     'a': 0.6, 'b': 0.6, 'c': 0.6, 'd': 0.6, 'e': 0.6, 'f': 0.4, 'g': 0.6, 'h': 0.6, 
     'i': 0.3, 'j': 0.3, 'k': 0.6, 'l': 0.3, 'm': 0.9, 'n': 0.6, 'o': 0.6, 'p': 0.6, 
     'q': 0.6, 'r': 0.4, 's': 0.6, 't': 0.4, 'u': 0.6, 'v': 0.6, 'w': 0.9, 'x': 0.6, 
@@ -165,23 +191,34 @@ CHAR_WIDTHS: Dict[str, float] = {
     ';': 0.3, '(': 0.3, ')': 0.3, '[': 0.3, ']': 0.3, '{': 0.3, '}': 0.3, '/': 0.3, 
     '\\': 0.3, '|': 0.3, '@': 0.9, '#': 0.9, '$': 0.9, '%': 0.9, '^': 0.9, '&': 0.9, 
     '*': 0.9, '+': 0.9, '=': 0.9, '"': 0.3, "'": 0.3, '\x00': 0.3
-}
+})
 
-VALID_CHARS: Set[str] = {
+VALID_CHARS: FrozenSet[str] = frozenset({
     '9', 'l', 'd', 'D', 'J', 'c', '6', 'V', '\x00', '-', '"', 'H', 't', 'r', '(', 'N', 
     'u', 'y', 'I', ';', '!', 'F', 'j', ')', '#', 'B', 'O', '4', 'M', 'W', 'f', '?', 
     '8', 'g', ',', '1', 'w', "'", 'A', 'm', 'K', 'C', 'o', ' ', ':', 'n', 'U', 'h', 
     's', 'q', '5', 'x', 'k', 'S', '0', 'Y', 'p', 'e', 'P', 'a', 'R', 'b', '2', '3', 
     'v', 'E', 'i', 'G', 'T', '7', '.', 'z', 'L'
-}
+})
+
+# Per-byte character widths; unknown characters default to 1.0
+WIDTH_LUT = np.full(256, 1.0, dtype=np.float64)
+for _char, _width in CHAR_WIDTHS.items():
+    WIDTH_LUT[ord(_char)] = _width
+
+# Plain-list mirror for scalar lookups: indexing a list from Python is much
+# cheaper than a NumPy gather for word-sized strings
+_WIDTH_TABLE: List[float] = WIDTH_LUT.tolist()
 
+@lru_cache(maxsize=8192)
 def calculate_text_width(text: str, font_width: float) -> float:
     """Calculate the approximate width of text in pixels"""
-    total_width = 0.0
-    for char in text:
-        char_width = CHAR_WIDTHS.get(char, 1.0)
-        total_width += char_width * font_width
-    return total_width
+    try:
+        buf = text.encode('latin-1')
+    except UnicodeEncodeError:
+        # Characters outside latin-1 are never in CHAR_WIDTHS
+        return sum(CHAR_WIDTHS.get(char, 1.0) for char in text) * font_width
+    return sum(map(_WIDTH_TABLE.__getitem__, buf)) * font_width
 
 # Global instances
 document_config = DocumentConfig()
@@ -2,15 +2,31 @@
 Document rendering system for converting processed text and strokes to SVG output.
 """
 
-import svgwrite
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, Union
 from dataclasses import dataclass
 from datetime import datetime
+from xml.sax.saxutils import escape
 
-from .config import document_config, text_config, calculate_text_width, TextAlignment, PageType
+from .config import document_config, text_config, calculate_text_width, TextAlignment, PageType, PAGE_TYPES
 
-@dataclass
+# CSS for page breaks when printing
+PRINT_STYLE = """
+            @media print {
+                .page {
+                    page-break-after: always;
+                    page-break-inside: avoid;
+                }
+                .page:last-child {
+                    page-break-after: auto;
+                }
+            }
+        """
+
+_ATTRIBUTE_ESCAPES = {'"': "&quot;"}
+
+@dataclass(slots=True)
 class WordLayout:
     """Layout information for a single word"""
     text: str
@@ -19,8 +35,9 @@ class WordLayout:
     y_position: float
     width: float
     page_number: int = 1
+    scale: float = 1.0  # Applied to the strokes when rendering
 
-@dataclass
+@dataclass(slots=True)
 class LineLayout:
     """Layout information for a single line"""
     words: List[WordLayout]
@@ -30,12 +47,115 @@ class LineLayout:
     page_number: int = 1
     page_type: PageType = PageType.ODD
 
+def word_to_path_d(strokes: np.ndarray, scale: float) -> str:
+    """
+    Build SVG path data for one word's scaled strokes, relative to the word's
+    baseline origin; the word is placed by translating its path.
+    
+    Strokes are expected as produced by HandwritingEngine: origin at the first
+    point and y measured down from the lowest point. Pure function of its
+    arguments so words can be formatted independently.
+    """
+    if len(strokes) == 0:
+        return ""
+    
+    xs = np.multiply(strokes[:, 0], scale)
+    ys = np.multiply(strokes[:, 1], scale)
+    
+    # A point starts a new subpath (M) when the previous point ended a stroke;
+    # otherwise it continues it, and coordinates after a moveto are implicit
+    # linetos, so no command letter is needed
+    prev_eos = np.empty(len(strokes))
+    prev_eos[0] = 1.0
+    prev_eos[1:] = strokes[:-1, 2]
+    commands = np.where(prev_eos == 1.0, "M", "").tolist()
+    
+    # Format from native floats; np.char.mod measured no faster than the loop
+    return " ".join([
+        f"{command}{x:.2f},{y:.2f}"
+        for command, x, y in zip(commands, xs.tolist(), ys.tolist())
+    ])
+
+class _SvgWriter:
+    """
+    Minimal SVG emitter that collects preformatted markup fragments.
+    
+    Attribute names follow svgwrite conventions: underscores become hyphens
+    and a trailing underscore is dropped (``class_`` -> ``class``).
+    """
+    
+    def __init__(self, width: float, height: float):
+        self.parts = [
+            '<?xml version="1.0" encoding="utf-8" ?>\n',
+            f'<svg xmlns="http://www.w3.org/2000/svg" baseProfile="full" version="1.1" '
+            f'width="{width}" height="{height}" viewBox="0,0,{width},{height}">'
+        ]
+    
+    @staticmethod
+    def _format_value(value: object) -> str:
+        # Coordinates never need more than path precision (2 decimals)
+        if isinstance(value, float):
+            return str(round(value, 2))
+        return escape(str(value), _ATTRIBUTE_ESCAPES)
+    
+    @classmethod
+    def _attributes(cls, attributes: Dict[str, object]) -> str:
+        return " ".join(
+            f'{name.rstrip("_").replace("_", "-")}="{cls._format_value(value)}"'
+            for name, value in attributes.items()
+        )
+    
+    def style(self, css: str):
+        self.parts.append(f'<defs><style type="text/css"><![CDATA[{css}]]></style></defs>')
+    
+    def open_group(self, **attributes):
+        self.parts.append(f"<g {self._attributes(attributes)}>")
+    
+    def close_group(self):
+        self.parts.append("</g>")
+    
+    def element(self, tag: str, **attributes):
+        self.parts.append(f"<{tag} {self._attributes(attributes)} />")
+    
+    def path(self, d: str, x: float, y: float):
+        """Add a path moved to (x, y), taking all other attributes from its enclosing group"""
+        self.parts.append(f'<path transform="translate({x:.2f},{y:.2f})" d="{d}"/>')
+    
+    def text(self, content: str, **attributes):
+        self.parts.append(f"<text {self._attributes(attributes)}>{escape(content)}</text>")
+    
+    def save(self, filename: str):
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("".join(self.parts))
+            f.write("</svg>")
+
 class DocumentRenderer:
     """Renders processed text and handwriting strokes to SVG format"""
     
-    def __init__(self):
+    def __init__(self, path_cache_size: int = 4096):
         self.doc_config = document_config
         self.text_config = text_config
+        self.path_cache_size = path_cache_size
+        # (id(strokes), scale) -> (strokes, path data); holding the strokes keeps their id unique
+        self._path_cache = OrderedDict()
+    
+    def _word_path_d(self, strokes: np.ndarray, scale: float) -> str:
+        """Get path data for a word's strokes, formatting read-only (cached) strokes only once"""
+        # Writeable strokes could change after formatting, so they are never cached
+        if strokes.flags.writeable:
+            return word_to_path_d(strokes, scale)
+        
+        key = (id(strokes), scale)
+        cached = self._path_cache.get(key)
+        if cached is not None and cached[0] is strokes:
+            self._path_cache.move_to_end(key)
+            return cached[1]
+        
+        path_data = word_to_path_d(strokes, scale)
+        self._path_cache[key] = (strokes, path_data)
+        if len(self._path_cache) > self.path_cache_size:
+            self._path_cache.popitem(last=False)
+        return path_data
     
     def create_line_layout(self, words: List[str], strokes_list: List[np.ndarray], 
                           line_number: int, alignment: TextAlignment, 
@@ -50,15 +170,13 @@ class DocumentRenderer:
         y_position = text_area_y + (line_number * self.doc_config.line_height)
         
         # Calculate word positions based on alignment
-        word_positions = self._calculate_word_positions(
+        word_positions, word_widths = self._calculate_word_positions(
             words, strokes_list, alignment, text_area_width, text_area_x
         )
         
         # Create WordLayout objects
         word_layouts = []
-        for word, strokes, x_pos in zip(words, strokes_list, word_positions):
-            word_width = self._calculate_stroke_width(strokes) if len(strokes) > 0 else calculate_text_width(word, self.text_config.font_width)
-            
+        for word, strokes, x_pos, word_width in zip(words, strokes_list, word_positions, word_widths):
             word_layouts.append(WordLayout(
                 text=word,
                 strokes=strokes,
@@ -79,10 +197,10 @@ class DocumentRenderer:
     
     def _calculate_word_positions(self, words: List[str], strokes_list: List[np.ndarray], 
                                  alignment: TextAlignment, text_area_width: float, 
-                                 text_area_x: float) -> List[float]:
-        """Calculate x positions for words based on alignment"""
+                                 text_area_x: float) -> Tuple[List[float], List[float]]:
+        """Calculate x positions for words based on alignment, along with the word widths used"""
         if not words:
-            return []
+            return [], []
         
         positions = []
         space_width = calculate_text_width(' ', self.text_config.font_width)
@@ -100,41 +218,30 @@ class DocumentRenderer:
         total_space_width = (len(words) - 1) * space_width if len(words) > 1 else 0
         total_content_width = total_word_width + total_space_width
         
+        # Alignment only decides where the line starts and how wide the gaps are
+        gap = space_width
         if alignment == TextAlignment.LEFT:
-            x_pos = text_area_x
-            for word_width in word_widths:
-                positions.append(x_pos)
-                x_pos += word_width + space_width
-                
+            start_x = text_area_x
         elif alignment == TextAlignment.RIGHT:
             start_x = text_area_x + text_area_width - total_content_width
-            x_pos = max(text_area_x, start_x)  # Don't go beyond left edge
-            for word_width in word_widths:
-                positions.append(x_pos)
-                x_pos += word_width + space_width
-                
+            start_x = max(text_area_x, start_x)  # Don't go beyond left edge
         elif alignment == TextAlignment.CENTER:
             start_x = text_area_x + (text_area_width - total_content_width) / 2
-            x_pos = max(text_area_x, start_x)  # Don't go beyond left edge
-            for word_width in word_widths:
-                positions.append(x_pos)
-                x_pos += word_width + space_width
-                
+            start_x = max(text_area_x, start_x)  # Don't go beyond left edge
         elif alignment == TextAlignment.JUSTIFY:
-            if len(words) == 1:
-                # Single word - align left
-                positions.append(text_area_x)
-            else:
-                # Distribute words across the line
-                available_space = text_area_width - total_word_width
-                space_between_words = available_space / (len(words) - 1)
-                
-                x_pos = text_area_x
-                for word_width in word_widths:
-                    positions.append(x_pos)
-                    x_pos += word_width + space_between_words
+            start_x = text_area_x
+            if len(words) > 1:
+                # Distribute words across the line; a single word aligns left
+                gap = (text_area_width - total_word_width) / (len(words) - 1)
+        else:
+            return positions, word_widths
         
-        return positions
+        x_pos = start_x
+        for word_width in word_widths:
+            positions.append(x_pos)
+            x_pos += word_width + gap
+        
+        return positions, word_widths
     
     def _calculate_stroke_width(self, strokes: np.ndarray) -> float:
         """Calculate the width of a stroke sequence"""
@@ -143,9 +250,14 @@ class DocumentRenderer:
         return abs(strokes[-1, 0] - strokes[0, 0])
     
     def render_to_svg(self, line_layouts: List[LineLayout], filename: str, 
-                    stroke_color: str = 'black', stroke_width: float = 1.0) -> str:
+                    stroke_color: str = 'black', stroke_width: float = 1.0,
+                    per_page: bool = False) -> Union[str, List[str]]:
         """
         Render the document to SVG format with proper multi-page support.
+        
+        With per_page=True each page is written to its own "{filename}-page-N.svg"
+        and the list of those filenames is returned, which keeps every file small
+        enough for browsers to display long documents smoothly.
         """
         svg_filename = f"{filename}.svg"
         
@@ -157,156 +269,126 @@ class DocumentRenderer:
                 pages[page_num] = []
             pages[page_num].append(line)
         
+        if per_page:
+            page_filenames = []
+            for page_num in sorted(pages.keys()):
+                page_filename = f"{filename}-page-{page_num}.svg"
+                svg = _SvgWriter(self.doc_config.page.width_px, self.doc_config.page.height_px)
+                svg.style(PRINT_STYLE)
+                self._render_page(svg, page_num, pages[page_num], 0, stroke_color, stroke_width)
+                svg.save(page_filename)
+                page_filenames.append(page_filename)
+            print(f"Per-page SVGs saved: {filename}-page-*.svg ({len(page_filenames)} pages)")
+            return page_filenames
+        
         # Calculate total document height (pages stacked vertically)
         num_pages = len(pages) if pages else 1
         total_height = num_pages * self.doc_config.page.height_px
         
         # Create SVG drawing with full document height
-        dwg = svgwrite.Drawing(
-            filename=svg_filename,
-            size=(self.doc_config.page.width_px, total_height)
-        )
-        dwg.viewbox(width=self.doc_config.page.width_px, height=total_height)
-        
-        # Add CSS for page breaks when printing
-        dwg.defs.add(dwg.style("""
-            @media print {
-                .page {
-                    page-break-after: always;
-                    page-break-inside: avoid;
-                }
-                .page:last-child {
-                    page-break-after: auto;
-                }
-            }
-        """))
+        svg = _SvgWriter(self.doc_config.page.width_px, total_height)
+        svg.style(PRINT_STYLE)
         
         # Render each page
         for page_num in sorted(pages.keys()):
-            page_lines = pages[page_num]
-            # Ensure correct page type determination
-            page_type = PageType.ODD if page_num % 2 == 1 else PageType.EVEN
-            
             # Calculate page Y offset
             page_y_offset = (page_num - 1) * self.doc_config.page.height_px
-            
-            # Create page group
-            page_group = dwg.g(class_="page", id=f"page-{page_num}")
-            
-            # Add page background
-            page_group.add(dwg.rect(
-                insert=(0, page_y_offset),
-                size=(self.doc_config.page.width_px, self.doc_config.page.height_px),
-                fill='white',
-                stroke='lightgray',
-                stroke_width=0.5
-            ))
-            
-            # Get page-specific margins and text area - RECALCULATE for this page
-            text_area_x, text_area_y, text_area_width, text_area_height = self.doc_config.get_text_area(page_type)
-            
-            # Add text area border if enabled - show the actual margins being used
-            if self.doc_config.draw_guidelines:
-                page_group.add(dwg.rect(
-                    insert=(text_area_x, text_area_y + page_y_offset),
-                    size=(text_area_width, text_area_height),
-                    stroke='lightblue',
-                    fill='none',
-                    stroke_width=0.5,
-                    opacity=0.3
-                ))
-                
-                # Add margin info as text for debugging
-                left, right, top, bottom = self.doc_config.margins.get_margins(page_type)
-                page_group.add(dwg.text(
-                    f"Page {page_num} ({'Odd' if page_type == PageType.ODD else 'Even'}) - L:{left} R:{right}",
-                    insert=(10, page_y_offset + 20),
-                    fill='red',
-                    font_size='12px'
-                ))
-                
-                # Add line guidelines
-                for i in range(1, self.doc_config.num_lines):
-                    y = text_area_y + page_y_offset + i * self.doc_config.line_height
-                    page_group.add(dwg.line(
-                        start=(text_area_x, y),
-                        end=(text_area_x + text_area_width, y),
-                        stroke='lightblue',
-                        stroke_width=0.3,
-                        opacity=0.3
-                    ))
-            
-            # Render lines on this page - ensure they use the correct margins
-            for line_layout in page_lines:
-                # Override the line's page type to ensure consistency
-                line_layout.page_type = page_type
-                for word_layout in line_layout.words:
-                    # Adjust word position for page offset
-                    adjusted_word = WordLayout(
-                        text=word_layout.text,
-                        strokes=word_layout.strokes,
-                        x_position=word_layout.x_position,
-                        y_position=word_layout.y_position + page_y_offset,
-                        width=word_layout.width,
-                        page_number=word_layout.page_number
-                    )
-                    self._render_word_strokes(page_group, adjusted_word, stroke_color, stroke_width)
-            
-            dwg.add(page_group)
+            self._render_page(svg, page_num, pages[page_num], page_y_offset, stroke_color, stroke_width)
         
         # Save SVG
-        dwg.save()
+        svg.save(svg_filename)
         print(f"Multi-page SVG saved: {svg_filename} ({num_pages} pages)")
         
         return svg_filename
     
-    def _render_word_strokes(self, parent_group: svgwrite.container.Group, 
-                            word_layout: WordLayout, stroke_color: str, stroke_width: float):
-        """Render strokes for a single word with proper baseline positioning"""
-        if len(word_layout.strokes) == 0:
-            return
+    def _render_page(self, svg: _SvgWriter, page_num: int, page_lines: List[LineLayout],
+                     page_y_offset: float, stroke_color: str, stroke_width: float):
+        """Render one page, shifted down by page_y_offset, into the SVG writer"""
+        # Ensure correct page type determination
+        page_type = PAGE_TYPES[page_num & 1]
         
-        # Apply scaling and positioning
-        strokes = word_layout.strokes.copy()
-        strokes[:, :2] *= self.text_config.scale
+        # Create page group
+        svg.open_group(class_="page", id=f"page-{page_num}")
+        
+        # Add page background
+        svg.element(
+            'rect',
+            x=0, y=page_y_offset,
+            width=self.doc_config.page.width_px, height=self.doc_config.page.height_px,
+            fill='white',
+            stroke='lightgray',
+            stroke_width=0.5
+        )
         
-        # Position the word
-        if len(strokes) > 0:
-            # Normalize strokes
-            strokes[:, 0] -= strokes[0, 0]  # Start at x=0
+        # Get page-specific margins and text area - RECALCULATE for this page
+        text_area_x, text_area_y, text_area_width, text_area_height = self.doc_config.get_text_area(page_type)
+        
+        # Add text area border if enabled - show the actual margins being used
+        if self.doc_config.draw_guidelines:
+            svg.element(
+                'rect',
+                x=text_area_x, y=text_area_y + page_y_offset,
+                width=text_area_width, height=text_area_height,
+                stroke='lightblue',
+                fill='none',
+                stroke_width=0.5,
+                opacity=0.3
+            )
             
-            # For Y positioning: word_layout.y_position is the baseline
-            # We need to position the strokes so their baseline aligns with this
-            stroke_bottom = strokes[:, 1].max()  # Bottom of the strokes
-            strokes[:, 1] = word_layout.y_position - (strokes[:, 1] - stroke_bottom)
+            # Add margin info as text for debugging
+            left, right, top, bottom = self.doc_config.margins.get_margins(page_type)
+            svg.text(
+                f"Page {page_num} ({('Even', 'Odd')[page_num & 1]}) - L:{left} R:{right}",
+                x=10, y=page_y_offset + 20,
+                fill='red',
+                font_size='12px'
+            )
             
-            # Apply X positioning
-            strokes[:, 0] += word_layout.x_position
+            # Add line guidelines
+            line_ys = text_area_y + page_y_offset + np.arange(1, self.doc_config.num_lines) * self.doc_config.line_height
+            for y in line_ys.tolist():
+                svg.element(
+                    'line',
+                    x1=text_area_x, y1=y,
+                    x2=text_area_x + text_area_width, y2=y,
+                    stroke='lightblue',
+                    stroke_width=0.3,
+                    opacity=0.3
+                )
         
-        # Generate SVG path
-        path_data = ""
-        prev_eos = 1.0
+        # Word paths share one stroke style, set once on their group
+        svg.open_group(
+            stroke=stroke_color,
+            stroke_width=stroke_width,
+            stroke_linecap='round',
+            fill='none'
+        )
         
-        for x, y, eos in strokes:
-            if prev_eos == 1.0:
-                path_data += f"M{x:.2f},{y:.2f} "
-            else:
-                path_data += f"L{x:.2f},{y:.2f} "
-            prev_eos = eos
+        # Render lines on this page - ensure they use the correct margins
+        for line_layout in page_lines:
+            # Override the line's page type to ensure consistency
+            line_layout.page_type = page_type
+            for word_layout in line_layout.words:
+                path_data = self._word_path_d(word_layout.strokes, self.text_config.scale * word_layout.scale)
+                if path_data:
+                    # Adjust word position for page offset
+                    svg.path(path_data, word_layout.x_position, word_layout.y_position + page_y_offset)
         
-        # Add path to SVG
-        if path_data.strip():
-            path = svgwrite.path.Path(path_data)
-            path = path.stroke(color=stroke_color, width=stroke_width, linecap='round').fill("none")
-            parent_group.add(path)
+        svg.close_group()
+        svg.close_group()
     
     def create_document_metadata(self, line_layouts: List[LineLayout]) -> Dict:
         """Create metadata about the rendered document"""
-        total_words = sum(len(line.words) for line in line_layouts)
-        total_chars = sum(sum(len(word.text) for word in line.words) for line in line_layouts)
+        total_words = 0
+        total_chars = 0
+        pages = set()
+        for line in line_layouts:
+            total_words += len(line.words)
+            for word in line.words:
+                total_chars += len(word.text)
+            pages.add(line.page_number)
         
         # Count pages
-        pages = set(line.page_number for line in line_layouts)
         num_pages = len(pages) if pages else 1
         
         return {
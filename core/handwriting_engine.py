@@ -8,6 +8,7 @@ import tensorflow.compat.v1 as tf
 from typing import List, Dict, Tuple, Optional
 import os
 import logging
+from collections import OrderedDict
 
 # Disable TensorFlow v2 behavior and logging
 tf.disable_v2_behavior()
@@ -17,22 +18,38 @@ from rnn import rnn
 import drawing
 from .config import rnn_config
 
+def _bucket(size: int) -> int:
+    """Round a size up to the next power of two"""
+    return 1 << (size - 1).bit_length()
+
+def _cache_key(word: str, bias: float, style: int) -> Tuple[str, float, int]:
+    """Stroke cache key; biases that differ only past 3 decimals share samples"""
+    return (word, round(float(bias), 3), int(style))
+
 class HandwritingEngine:
     """Core engine for generating handwriting strokes from text"""
     
-    def __init__(self, checkpoint_dir: str = 'checkpoints', warm_start_step: int = 17900):
+    def __init__(self, checkpoint_dir: str = 'checkpoints', warm_start_step: int = 17900,
+                 cache_size: int = 4096, use_xla: bool = False):
         """
         Initialize the handwriting engine.
         
         Args:
             checkpoint_dir: Directory containing model checkpoints
             warm_start_step: Step number to load for warm start
+            cache_size: Maximum number of generated words kept in the stroke cache
+            use_xla: JIT-compile the sampling graph with XLA; batches are padded to
+                power-of-two shapes so compiled kernels get reused
         """
         self.checkpoint_dir = checkpoint_dir
         self.warm_start_step = warm_start_step
         self._model = None
         self._session = None
-        self._stroke_cache = {}  # Cache for generated strokes
+        self._sample_fn = None
+        self.cache_size = cache_size
+        self.use_xla = use_xla
+        self._stroke_cache = OrderedDict()  # LRU cache for generated strokes
+        self._style_cache: Dict[int, Optional[Tuple[np.ndarray, str]]] = {}  # Style priming data
         
         self._initialize_model()
     
@@ -43,6 +60,15 @@ class HandwritingEngine:
         # Suppress TensorFlow logging
         logging.getLogger('tensorflow').setLevel(logging.ERROR)
         
+        # Sampling steps one small LSTM cell at a time, so a single op-level pool
+        # sized to the physical cores beats the oversubscribed defaults. Read when
+        # the session is created; values already set in the environment win.
+        os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(max(1, (os.cpu_count() or 2) // 2)))
+        os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+        if self.use_xla:
+            # Must be set before the session is created
+            os.environ.setdefault('TF_XLA_FLAGS', '--tf_xla_auto_jit=2')
+        
         self._model = rnn(
             log_dir='logs',
             checkpoint_dir=self.checkpoint_dir,
@@ -70,6 +96,21 @@ class HandwritingEngine:
         # Restore the model
         self._model.restore()
         self._session = self._model.session
+        
+        # Build the sampling call once instead of parsing a feed dict per run
+        self._sample_fn = self._session.make_callable(
+            [self._model.sampled_sequence, self._model.sampled_lengths],
+            feed_list=[
+                self._model.prime,
+                self._model.x_prime,
+                self._model.x_prime_len,
+                self._model.num_samples,
+                self._model.sample_tsteps,
+                self._model.c,
+                self._model.c_len,
+                self._model.bias
+            ]
+        )
         print("Model initialized successfully")
     
     def generate_word_strokes(self, word: str, bias: float = None, style: int = None) -> Tuple[np.ndarray, float]:
@@ -84,100 +125,221 @@ class HandwritingEngine:
         Returns:
             Tuple of (strokes, actual_width)
         """
+        return self.generate_words_batch([word], [bias], [style])[0]
+    
+    def generate_words_batch(self, words: List[str], biases: List[Optional[float]], 
+                             styles: List[Optional[int]]) -> List[Tuple[np.ndarray, float]]:
+        """
+        Generate handwriting strokes for several words, batching model runs.
+        
+        Cached words are not regenerated, and repeated words are sampled once.
+        Words are sampled in one model run per group of similar lengths.
+        
+        Args:
+            words: The words to generate strokes for
+            biases: RNN bias parameter per word (None for the config default)
+            styles: Style parameter per word (None for the config default)
+            
+        Returns:
+            List of (strokes, actual_width) tuples in the same order as words
+        """
+        keys = []
+        results = {}
+        missing = {}
+        for word, bias, style in zip(words, biases, styles):
+            if bias is None:
+                bias = rnn_config.default_bias
+            if style is None:
+                style = rnn_config.default_style
+            
+            cache_key = _cache_key(word, bias, style)
+            keys.append(cache_key)
+            if cache_key in self._stroke_cache:
+                self._stroke_cache.move_to_end(cache_key)
+                results[cache_key] = self._stroke_cache[cache_key]
+            else:
+                missing[cache_key] = (word, bias, style)
+        
+        if missing:
+            # Sample similar-length words together: a run lasts as long as its
+            # longest word, so short words should not wait on long ones
+            pending = sorted(missing, key=lambda cache_key: len(cache_key[0]))
+            start = 0
+            while start < len(pending):
+                shortest = len(pending[start][0])
+                end = start + 1
+                while end < len(pending) and len(pending[end][0]) - shortest <= rnn_config.length_bucket_span:
+                    end += 1
+                
+                group = pending[start:end]
+                start = end
+                try:
+                    group_words, group_biases, group_styles = zip(*(missing[cache_key] for cache_key in group))
+                    samples = self._generate_strokes(list(group_words), list(group_biases), list(group_styles))
+                    
+                    for cache_key, strokes in zip(group, samples):
+                        # Process strokes
+                        strokes = self._process_strokes(strokes)
+                        
+                        # Calculate actual width
+                        if len(strokes) > 0:
+                            actual_width = strokes[-1, 0] - strokes[0, 0]
+                        else:
+                            actual_width = 0.0
+                        
+                        # Cached strokes are shared by every layout using the word
+                        strokes.flags.writeable = False
+                        
+                        # Cache the result, evicting the least recently used words
+                        results[cache_key] = (strokes, actual_width)
+                        self._stroke_cache[cache_key] = results[cache_key]
+                        if len(self._stroke_cache) > self.cache_size:
+                            self._stroke_cache.popitem(last=False)
+                    
+                except Exception as e:
+                    print(f"Error generating strokes for words {[cache_key[0] for cache_key in group]}: {e}")
+                    # Return empty strokes as fallback for this group only
+                    for cache_key in group:
+                        results.setdefault(cache_key, (np.array([[0, 0, 1]]), 0.0))
+        
+        return [results[cache_key] for cache_key in keys]
+    
+    def forget_word(self, word: str, bias: float = None, style: int = None):
+        """Drop the cached strokes for a word so its next generation samples anew"""
         if bias is None:
             bias = rnn_config.default_bias
         if style is None:
             style = rnn_config.default_style
+        self._stroke_cache.pop(_cache_key(word, bias, style), None)
+    
+    def save_cache(self, path: str):
+        """Write the stroke cache to ``path`` so a restarted engine starts warm"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
         
-        # Check cache
-        cache_key = f"{word}_{bias}_{style}"
-        if cache_key in self._stroke_cache:
-            return self._stroke_cache[cache_key]
+        # Store plain arrays (strokes concatenated, split by offsets) so loading never unpickles
+        entries = list(self._stroke_cache.items())
+        stroke_arrays = [strokes for _, (strokes, _) in entries]
+        offsets = np.cumsum([0] + [len(strokes) for strokes in stroke_arrays])
         
+        # Write a temporary file and swap it in, so a crash mid-write keeps the old cache
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(
+                f,
+                checkpoint_dir=np.array(self.checkpoint_dir),
+                warm_start_step=np.array(self.warm_start_step),
+                words=np.array([cache_key[0] for cache_key, _ in entries], dtype=str),
+                biases=np.array([cache_key[1] for cache_key, _ in entries], dtype=float),
+                styles=np.array([cache_key[2] for cache_key, _ in entries], dtype=int),
+                widths=np.array([actual_width for _, (_, actual_width) in entries], dtype=float),
+                offsets=offsets,
+                strokes=np.concatenate(stroke_arrays) if stroke_arrays else np.zeros((0, 3))
+            )
+        os.replace(temp_path, path)
+    
+    def load_cache(self, path: str):
+        """Fill the stroke cache from a file written by save_cache, if it matches this model"""
+        loaded = OrderedDict()
         try:
-            strokes = self._generate_strokes([word], [bias], [style])[0]
-            
-            # Process strokes
-            strokes = self._process_strokes(strokes)
-            
-            # Calculate actual width
-            if len(strokes) > 0:
-                actual_width = strokes[-1, 0] - strokes[0, 0]
-            else:
-                actual_width = 0.0
-            
-            # Cache the result
-            result = (strokes, actual_width)
-            self._stroke_cache[cache_key] = result
+            with np.load(path, allow_pickle=False) as data:
+                # Strokes sampled from another checkpoint would not match new ones
+                if (str(data['checkpoint_dir']), int(data['warm_start_step'])) != (self.checkpoint_dir, self.warm_start_step):
+                    return
+                
+                words, biases, styles = data['words'], data['biases'], data['styles']
+                widths, offsets, strokes = data['widths'], data['offsets'], data['strokes']
             
-            return result
+            if not len(words) == len(biases) == len(styles) == len(widths) == len(offsets) - 1:
+                raise ValueError("mismatched cache arrays")
+            if strokes.ndim != 2 or strokes.shape[1] != 3 or offsets[-1] != len(strokes):
+                raise ValueError("malformed stroke array")
             
+            strokes.flags.writeable = False
+            first = max(len(words) - self.cache_size, 0)
+            for index in range(first, len(words)):
+                cache_key = (str(words[index]), float(biases[index]), int(styles[index]))
+                loaded[cache_key] = (strokes[offsets[index]:offsets[index + 1]], float(widths[index]))
+        except FileNotFoundError:
+            return
         except Exception as e:
-            print(f"Error generating strokes for word '{word}': {e}")
-            # Return empty strokes as fallback
-            return np.array([[0, 0, 1]]), 0.0
+            print(f"Ignoring unreadable stroke cache {path}: {e}")
+            return
+        
+        # Only a fully valid cache is used
+        self._stroke_cache.update(loaded)
     
     def _generate_strokes(self, words: List[str], biases: List[float], styles: List[int]) -> List[np.ndarray]:
         """Generate strokes for multiple words using the RNN model"""
         num_samples = len(words)
         max_tsteps = 100 * max(len(word) for word in words)
         
-        # Prepare character arrays
-        x_prime = np.zeros([num_samples, 1600, 3])
-        x_prime_len = np.zeros([num_samples])
-        chars = np.zeros([num_samples, 160])
-        chars_len = np.zeros([num_samples])
-        
         # Check if we should use style priming
         use_styles = any(style is not None for style in styles)
         
-        if use_styles:
-            for i, (word, style) in enumerate(zip(words, styles)):
-                if style is not None:
-                    try:
-                        x_p = np.load(f'styles/style-{style}-strokes.npy')
-                        c_p = np.load(f'styles/style-{style}-chars.npy').tostring().decode('utf-8')
-                        c_p = str(c_p) + " " + word
-                        c_p = drawing.encode_ascii(c_p)
-                        c_p = np.array(c_p)
-                        
-                        x_prime[i, :len(x_p), :] = x_p
-                        x_prime_len[i] = len(x_p)
-                        chars[i, :len(c_p)] = c_p
-                        chars_len[i] = len(c_p)
-                    except FileNotFoundError:
-                        print(f"Warning: Style {style} not found, using default")
-                        encoded = drawing.encode_ascii(word)
-                        chars[i, :len(encoded)] = encoded
-                        chars_len[i] = len(encoded)
+        # Encode each sample's text, prefixed by the style's prime text when primed
+        primes = []
+        encodings = []
+        for word, style in zip(words, styles):
+            x_p = None
+            if style is not None:
+                style_data = self._load_style(style)
+                if style_data is not None:
+                    x_p, prime_text = style_data
+                    encodings.append(drawing.encode_ascii(prime_text + " " + word))
                 else:
-                    encoded = drawing.encode_ascii(word)
-                    chars[i, :len(encoded)] = encoded
-                    chars_len[i] = len(encoded)
-        else:
-            for i, word in enumerate(words):
-                encoded = drawing.encode_ascii(word)
-                chars[i, :len(encoded)] = encoded
-                chars_len[i] = len(encoded)
+                    print(f"Warning: Style {style} not found, using default")
+            if x_p is None:
+                encodings.append(drawing.encode_ascii(word))
+            primes.append(x_p)
+        
+        # Prepare feed arrays sized to the longest prime and text in this batch
+        batch_size = num_samples
+        max_prime_len = max((len(x_p) for x_p in primes if x_p is not None), default=1)
+        max_chars_len = max(len(encoded) for encoded in encodings)
+        if self.use_xla:
+            # XLA compiles once per input shape, so round shapes up to a few buckets
+            batch_size = _bucket(batch_size)
+            max_prime_len = _bucket(max_prime_len)
+            max_chars_len = _bucket(max_chars_len)
+        
+        x_prime = np.zeros([batch_size, max_prime_len, 3])
+        x_prime_len = np.zeros([batch_size])
+        chars = np.zeros([batch_size, max_chars_len])
+        chars_len = np.zeros([batch_size])
+        
+        for i, (x_p, encoded) in enumerate(zip(primes, encodings)):
+            if x_p is not None:
+                x_prime[i, :len(x_p), :] = x_p
+                x_prime_len[i] = len(x_p)
+            chars[i, :len(encoded)] = encoded
+            chars_len[i] = len(encoded)
+        
+        if batch_size > num_samples:
+            # Padding rows keep zero-length prime and text. With no characters to
+            # attend to, the sampler's termination condition already holds on the
+            # initial state, so they never lengthen the run.
+            biases = list(biases) + [biases[0]] * (batch_size - num_samples)
         
         # Run the model
-        [samples] = self._session.run(
-            [self._model.sampled_sequence],
-            feed_dict={
-                self._model.prime: use_styles,
-                self._model.x_prime: x_prime,
-                self._model.x_prime_len: x_prime_len,
-                self._model.num_samples: num_samples,
-                self._model.sample_tsteps: max_tsteps,
-                self._model.c: chars,
-                self._model.c_len: chars_len,
-                self._model.bias: biases
-            }
+        samples, lengths = self._sample_fn(
+            use_styles, x_prime, x_prime_len, batch_size, max_tsteps, chars, chars_len, biases
         )
         
-        # Clean up samples
-        samples = [sample[~np.all(sample == 0.0, axis=1)] for sample in samples]
-        return samples
+        # Clean up samples: drop the zero rows padding each finished sample
+        return [sample[:length] for sample, length in zip(samples[:num_samples], lengths[:num_samples])]
+    
+    def _load_style(self, style: int) -> Optional[Tuple[np.ndarray, str]]:
+        """Load priming strokes and text for a style, reading each style from disk only once"""
+        if style not in self._style_cache:
+            try:
+                x_p = np.load(f'styles/style-{style}-strokes.npy')
+                prime_text = np.load(f'styles/style-{style}-chars.npy').tobytes().decode('utf-8')
+                self._style_cache[style] = (x_p, prime_text)
+            except FileNotFoundError:
+                self._style_cache[style] = None
+        return self._style_cache[style]
     
     def _process_strokes(self, strokes: np.ndarray) -> np.ndarray:
         """Process raw strokes from the model"""
@@ -193,6 +355,11 @@ class HandwritingEngine:
         # Align strokes
         coords[:, :2] = drawing.align(coords[:, :2])
         
+        # Put the origin at the first point and measure y down from the lowest
+        # point, so renderers only need to scale and translate cached strokes
+        coords[:, 0] -= coords[0, 0]
+        coords[:, 1] = coords[:, 1].max() - coords[:, 1]
+        
         return coords
     
     def close(self):
@@ -2,23 +2,54 @@
 Enhanced markup parser supporting multiple text styles and formatting.
 """
 
-import re
-from typing import List, Dict, Tuple, Optional, Any
+try:
+    import re2 as re  # google-re2: linear-time matching, same compile/finditer API
+except ImportError:
+    import re
+from typing import List, Dict, Tuple, Optional, Any, Mapping
 from dataclasses import dataclass
-
-from .config import TextStyle, PREDEFINED_STYLES, TextAlignment
-
-@dataclass
+from types import MappingProxyType
+
+from .config import TextStyle, PREDEFINED_STYLES, TextAlignment, MarkerKind, style_variant
+
+# Markup patterns are compiled once at import and shared by every parser.
+# _MARKUP_RE alternates over every in-page markup type so a page is scanned once.
+_MARKUP_RE = re.compile(
+    r'(?s)'  # inline DOTALL, since re2 has no flag constants
+    r'\[style:(?P<style>\w+)\](?P<style_text>.*?)\[/style\]'
+    r'|\[align:(?P<align>left|center|right|justify)\](?P<align_text>.*?)\[/align\]'
+    r'|\[bias:(?P<bias>[\d.]+)\](?P<bias_text>.*?)\[/bias\]'
+    r'|(?P<line_break>\[line-break\])'
+)
+_WORD_RE = re.compile(r'\[word:(.*?)\](.*?)\[/word\]')
+_PARAM_RE = re.compile(r'([^,=]*)=([^,]*)')  # key=value pairs inside [word:...]
+_PARAM_TYPES = {'bias': float, 'style': int}  # other word parameters stay strings
+_PAGE_BREAK = '[page-break]'  # literal, so pages are split with str.split
+
+@dataclass(slots=True)
 class TextBlock:
     """Represents a block of text with specific styling"""
     text: str
     style: TextStyle
-    custom_words: Dict[str, Dict[str, Any]] = None  # Word-specific overrides
+    custom_words: Mapping[str, Dict[str, Any]] = None  # Word-specific overrides
+    marker: MarkerKind = MarkerKind.NONE  # Set on page/line break markers
     
     def __post_init__(self):
         if self.custom_words is None:
             self.custom_words = {}
 
+# Break markers carry no text to lay out, so one shared instance of each is enough.
+# Their overrides are read-only, so no caller can leak words into later parses.
+_NO_CUSTOM_WORDS: Mapping[str, Dict[str, Any]] = MappingProxyType({})
+_PAGE_BREAK_BLOCK = TextBlock(
+    text="[PAGE_BREAK]", style=PREDEFINED_STYLES['body'],
+    custom_words=_NO_CUSTOM_WORDS, marker=MarkerKind.PAGE_BREAK
+)
+_LINE_BREAK_BLOCK = TextBlock(
+    text="[LINE_BREAK]", style=PREDEFINED_STYLES['body'],
+    custom_words=_NO_CUSTOM_WORDS, marker=MarkerKind.LINE_BREAK
+)
+
 class MarkupParser:
     """
     Parser for custom markup language supporting multiple text styles.
@@ -32,164 +63,106 @@ class MarkupParser:
     - [line-break] - Force line break
     """
     
-    def __init__(self):
-        self.style_pattern = re.compile(r'\[style:(\w+)\](.*?)\[/style\]', re.DOTALL)
-        self.align_pattern = re.compile(r'\[align:(left|center|right|justify)\](.*?)\[/align\]', re.DOTALL)
-        self.bias_pattern = re.compile(r'\[bias:([\d.]+)\](.*?)\[/bias\]', re.DOTALL)
-        self.word_pattern = re.compile(r'\[word:(.*?)\](.*?)\[/word\]')
-        self.page_break_pattern = re.compile(r'\[page-break\]')
-        self.line_break_pattern = re.compile(r'\[line-break\]')
-        
     def parse(self, markup_text: str) -> List[TextBlock]:
         """Parse markup text into styled text blocks"""
         blocks = []
         
         # Split by page breaks first
-        pages = self.page_break_pattern.split(markup_text)
+        pages = markup_text.split(_PAGE_BREAK)
+        last_index = len(pages) - 1
         
-        for page_text in pages:
-            if not page_text.strip():
+        for index, page_text in enumerate(pages):
+            if not page_text or page_text.isspace():
                 continue
                 
             page_blocks = self._parse_page(page_text)
             blocks.extend(page_blocks)
             
             # Add page break marker (except for last page)
-            if page_text != pages[-1]:
-                blocks.append(TextBlock(text="[PAGE_BREAK]", style=PREDEFINED_STYLES['body']))
+            if index < last_index:
+                blocks.append(_PAGE_BREAK_BLOCK)
         
         return blocks
     
     def _parse_page(self, page_text: str) -> List[TextBlock]:
         """Parse a single page of text"""
         blocks = []
+        last_end = 0
         
-        # Process different markup types in order of precedence
-        remaining_text = page_text
-        
-        while remaining_text.strip():
-            # Look for the next markup
-            next_match, match_type = self._find_next_markup(remaining_text)
-            
-            if next_match is None:
-                # No more markup, process remaining text as body
-                if remaining_text.strip():
-                    blocks.append(self._create_text_block(remaining_text, PREDEFINED_STYLES['body']))
-                break
-            
+        for match in _MARKUP_RE.finditer(page_text):
             # Add text before the markup (if any)
-            before_text = remaining_text[:next_match.start()]
-            if before_text.strip():
+            before_text = page_text[last_end:match.start()]
+            if before_text and not before_text.isspace():
                 blocks.append(self._create_text_block(before_text, PREDEFINED_STYLES['body']))
             
             # Process the markup
-            if match_type == 'style':
-                blocks.append(self._parse_style_block(next_match))
-            elif match_type == 'align':
-                blocks.append(self._parse_align_block(next_match))
-            elif match_type == 'bias':
-                blocks.append(self._parse_bias_block(next_match))
+            match_type = match.lastgroup
+            if match_type == 'style_text':
+                blocks.append(self._parse_style_block(match.group('style'), match.group('style_text')))
+            elif match_type == 'align_text':
+                blocks.append(self._parse_align_block(match.group('align'), match.group('align_text')))
+            elif match_type == 'bias_text':
+                blocks.append(self._parse_bias_block(match.group('bias'), match.group('bias_text')))
             elif match_type == 'line_break':
-                blocks.append(TextBlock(text="[LINE_BREAK]", style=PREDEFINED_STYLES['body']))
+                blocks.append(_LINE_BREAK_BLOCK)
             
-            # Continue with remaining text
-            remaining_text = remaining_text[next_match.end():]
+            last_end = match.end()
         
-        return blocks
-    
-    def _find_next_markup(self, text: str) -> Tuple[Optional[re.Match], Optional[str]]:
-        """Find the next markup element in the text"""
-        matches = [
-            (self.style_pattern.search(text), 'style'),
-            (self.align_pattern.search(text), 'align'),
-            (self.bias_pattern.search(text), 'bias'),
-            (self.line_break_pattern.search(text), 'line_break'),
-        ]
-        
-        # Filter out None matches and find the earliest one
-        valid_matches = [(match, match_type) for match, match_type in matches if match is not None]
+        # No more markup, process remaining text as body
+        remaining_text = page_text[last_end:]
+        if remaining_text and not remaining_text.isspace():
+            blocks.append(self._create_text_block(remaining_text, PREDEFINED_STYLES['body']))
         
-        if not valid_matches:
-            return None, None
-        
-        # Return the match that appears first in the text
-        earliest_match = min(valid_matches, key=lambda x: x[0].start())
-        return earliest_match
+        return blocks
     
-    def _parse_style_block(self, match: re.Match) -> TextBlock:
+    def _parse_style_block(self, style_name: str, text_content: str) -> TextBlock:
         """Parse a style block [style:name]text[/style]"""
-        style_name = match.group(1)
-        text_content = match.group(2)
-        
-        style = PREDEFINED_STYLES.get(style_name, PREDEFINED_STYLES['body']).copy()
-        
-        # Process word-specific overrides within the block
-        custom_words = self._extract_word_overrides(text_content)
-        
-        # Remove word markup from text
-        clean_text = self.word_pattern.sub(r'\2', text_content)
-        
-        return TextBlock(text=clean_text, style=style, custom_words=custom_words)
+        style = PREDEFINED_STYLES.get(style_name, PREDEFINED_STYLES['body'])
+        return self._create_text_block(text_content, style)
     
-    def _parse_align_block(self, match: re.Match) -> TextBlock:
+    def _parse_align_block(self, align_name: str, text_content: str) -> TextBlock:
         """Parse an alignment block [align:direction]text[/align]"""
-        align_name = match.group(1)
-        text_content = match.group(2)
-        
-        style = PREDEFINED_STYLES['body'].copy()
-        style.alignment = TextAlignment(align_name)
-        
-        custom_words = self._extract_word_overrides(text_content)
-        clean_text = self.word_pattern.sub(r'\2', text_content)
-        
-        return TextBlock(text=clean_text, style=style, custom_words=custom_words)
+        style = style_variant(PREDEFINED_STYLES['body'], alignment=TextAlignment(align_name))
+        return self._create_text_block(text_content, style)
     
-    def _parse_bias_block(self, match: re.Match) -> TextBlock:
+    def _parse_bias_block(self, bias_value: str, text_content: str) -> TextBlock:
         """Parse a bias block [bias:value]text[/bias]"""
-        bias_value = float(match.group(1))
-        text_content = match.group(2)
-        
-        style = PREDEFINED_STYLES['body'].copy()
-        style.bias = bias_value
-        
-        custom_words = self._extract_word_overrides(text_content)
-        clean_text = self.word_pattern.sub(r'\2', text_content)
-        
-        return TextBlock(text=clean_text, style=style, custom_words=custom_words)
+        style = style_variant(PREDEFINED_STYLES['body'], bias=float(bias_value))
+        return self._create_text_block(text_content, style)
     
-    def _extract_word_overrides(self, text: str) -> Dict[str, Dict[str, Any]]:
-        """Extract word-specific style overrides"""
+    def _strip_word_markup(self, text: str) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+        """Remove word markup from text, returning the clean text and word-specific style overrides"""
+        # Most blocks have no word markup at all
+        if '[word:' not in text:
+            return text, {}
+        
         custom_words = {}
+        pieces = []
+        last_end = 0
         
-        for match in self.word_pattern.finditer(text):
+        for match in _WORD_RE.finditer(text):
             params_str = match.group(1)
             word = match.group(2)
             
+            # Keep the word itself in place of its markup
+            pieces.append(text[last_end:match.start()])
+            pieces.append(word)
+            last_end = match.end()
+            
             # Parse parameters
             params = {}
-            for param in params_str.split(','):
-                if '=' in param:
-                    key, value = param.strip().split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    # Convert values to appropriate types
-                    if key in ['bias']:
-                        params[key] = float(value)
-                    elif key in ['style']:
-                        params[key] = int(value)
-                    else:
-                        params[key] = value
+            for key, value in _PARAM_RE.findall(params_str):
+                key = key.strip()
+                params[key] = _PARAM_TYPES.get(key, str)(value.strip())
             
             custom_words[word] = params
         
-        return custom_words
+        pieces.append(text[last_end:])
+        return "".join(pieces), custom_words
     
     def _create_text_block(self, text: str, base_style: TextStyle) -> TextBlock:
         """Create a text block with word overrides processed"""
-        custom_words = self._extract_word_overrides(text)
-        clean_text = self.word_pattern.sub(r'\2', text)
-        
+        clean_text, custom_words = self._strip_word_markup(text)
         return TextBlock(text=clean_text, style=base_style, custom_words=custom_words)
 
 # Example markup templates
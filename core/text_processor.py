@@ -2,36 +2,75 @@
 Enhanced text processor with markup support and page-aware layout.
 """
 
-import re
+from bisect import bisect_right
+from itertools import accumulate
 from typing import List, Dict, Tuple, Optional, Any
 from dataclasses import dataclass
 
-from .config import document_config, text_config, calculate_text_width, PageType, TextStyle
+from .config import document_config, text_config, calculate_text_width, PageType, PAGE_TYPES, TextStyle, MarkerKind
 from .markup_parser import MarkupParser, TextBlock
 
-@dataclass
-class ProcessedWord:
-    """Word with processing metadata"""
-    text: str
-    style_overrides: Dict[str, Any]
-    estimated_width: float
+@dataclass(slots=True)
+class WordBatch:
+    """Words with processing metadata, stored column-wise (one entry per word)"""
+    texts: List[str]
+    style_overrides: List[Optional[Dict[str, Any]]]  # None for words without overrides
+    font_width: float
+    estimated_widths: Optional[List[float]] = None  # Filled in by widths() on first use
     
-@dataclass
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def widths(self) -> List[float]:
+        """Get the estimated width of each word, computing them on first use"""
+        if self.estimated_widths is None:
+            font_width = self.font_width
+            self.estimated_widths = [calculate_text_width(word, font_width) for word in self.texts]
+        return self.estimated_widths
+    
+    def slice(self, start: int, end: int) -> "WordBatch":
+        """Get the words in [start, end) as a new batch"""
+        return WordBatch(
+            texts=self.texts[start:end],
+            style_overrides=self.style_overrides[start:end],
+            font_width=self.font_width,
+            estimated_widths=None if self.estimated_widths is None else self.estimated_widths[start:end]
+        )
+    
+@dataclass(slots=True)
 class ProcessedLine:
     """Line with layout information"""
-    words: List[ProcessedWord]
+    words: WordBatch
     style: TextStyle
     line_number: int
     page_number: int
     page_type: PageType
     
-@dataclass
+@dataclass(slots=True)
 class ProcessedPage:
     """Page with all its lines"""
     lines: List[ProcessedLine]
     page_number: int
     page_type: PageType
 
+def word_char_ends(words: List[str]) -> List[int]:
+    """
+    Prefix sums of word length plus one trailing space, so the characters
+    in words[start:end] (with separating spaces) are char_ends[end] - char_ends[start] - 1.
+    """
+    return list(accumulate((len(word) + 1 for word in words), initial=0))
+
+def fit_words_to_line(char_ends: List[int], start: int) -> int:
+    """
+    Fit words to a line PRIORITIZING character limit over width.
+    
+    Returns the index just past the last word (from ``start``) that fits,
+    found by bisecting the ``word_char_ends`` prefix sums.
+    """
+    # Words start..end-1 fit while char_ends[end] - char_ends[start] - 1 <= limit
+    limit = char_ends[start] + text_config.max_chars_per_line + 1
+    return bisect_right(char_ends, limit, lo=start) - 1
+
 class TextProcessor:
     """Enhanced text processor with markup and page layout support"""
     
@@ -50,10 +89,10 @@ class TextProcessor:
         current_line_number = 0
         
         for block in text_blocks:
-            if block.text == "[PAGE_BREAK]":
+            if block.marker == MarkerKind.PAGE_BREAK:
                 # Finish current page
                 if current_page_lines:
-                    page_type = PageType.ODD if current_page_number % 2 == 1 else PageType.EVEN
+                    page_type = PAGE_TYPES[current_page_number & 1]
                     pages.append(ProcessedPage(
                         lines=current_page_lines,
                         page_number=current_page_number,
@@ -64,7 +103,7 @@ class TextProcessor:
                     current_line_number = 0
                 continue
             
-            if block.text == "[LINE_BREAK]":
+            if block.marker == MarkerKind.LINE_BREAK:
                 current_line_number += 1
                 continue
             
@@ -80,7 +119,7 @@ class TextProcessor:
                 if current_line_number >= self.doc_config.num_lines:
                     # Finish current page
                     if current_page_lines:
-                        page_type = PageType.ODD if current_page_number % 2 == 1 else PageType.EVEN
+                        page_type = PAGE_TYPES[current_page_number & 1]
                         pages.append(ProcessedPage(
                             lines=current_page_lines,
                             page_number=current_page_number,
@@ -93,14 +132,14 @@ class TextProcessor:
                 # Update line metadata
                 line.line_number = current_line_number
                 line.page_number = current_page_number
-                line.page_type = PageType.ODD if current_page_number % 2 == 1 else PageType.EVEN
+                line.page_type = PAGE_TYPES[current_page_number & 1]
                 
                 current_page_lines.append(line)
                 current_line_number += 1
         
         # Add final page if it has content
         if current_page_lines:
-            page_type = PageType.ODD if current_page_number % 2 == 1 else PageType.EVEN
+            page_type = PAGE_TYPES[current_page_number & 1]
             pages.append(ProcessedPage(
                 lines=current_page_lines,
                 page_number=current_page_number,
@@ -112,45 +151,41 @@ class TextProcessor:
     def _process_text_block(self, block: TextBlock, page_number: int, start_line: int) -> List[ProcessedLine]:
         """Process a text block into lines"""
         # Get page type and text area
-        page_type = PageType.ODD if page_number % 2 == 1 else PageType.EVEN
+        page_type = PAGE_TYPES[page_number & 1]
         text_area_x, text_area_y, text_area_width, text_area_height = self.doc_config.get_text_area(page_type)
         
         # Split text into words
-        words = re.findall(r'\S+', block.text)
+        words = block.text.split()
         
-        # Process words with style overrides
-        processed_words = []
-        for word in words:
-            style_overrides = block.custom_words.get(word, {})
-            estimated_width = calculate_text_width(word, block.style.font_width)
-            
-            processed_words.append(ProcessedWord(
-                text=word,
-                style_overrides=style_overrides,
-                estimated_width=estimated_width
-            ))
+        # Process words with style overrides; widths are estimated only if asked for
+        processed_words = WordBatch(
+            texts=words,
+            style_overrides=(
+                [block.custom_words.get(word) for word in words]
+                if block.custom_words else [None] * len(words)
+            ),
+            font_width=block.style.font_width
+        )
+        
+        char_ends = word_char_ends(words)
         
         # Fit words into lines
         lines = []
-        remaining_words = processed_words
+        skipped_words = []
+        line_start = 0
         line_number = start_line
         
-        while remaining_words:
-            line_words, remaining_words = self._fit_words_to_line(
-                remaining_words, 
-                text_area_width, 
-                block.style
-            )
+        while line_start < len(processed_words):
+            line_end = fit_words_to_line(char_ends, line_start)
             
-            if not line_words:
+            if line_end == line_start:
                 # Skip problematic word
-                if remaining_words:
-                    print(f"Warning: Skipping word '{remaining_words[0].text}' - too long for line")
-                    remaining_words = remaining_words[1:]
+                skipped_words.append(words[line_start])
+                line_start += 1
                 continue
             
             lines.append(ProcessedLine(
-                words=line_words,
+                words=processed_words.slice(line_start, line_end),
                 style=block.style,
                 line_number=line_number,
                 page_number=page_number,
@@ -158,37 +193,15 @@ class TextProcessor:
             ))
             
             line_number += 1
+            line_start = line_end
         
-        return lines
-    
-    def _fit_words_to_line(self, words: List[ProcessedWord], max_width: float, 
-                          style: TextStyle) -> Tuple[List[ProcessedWord], List[ProcessedWord]]:
-        """Fit words to a line PRIORITIZING character limit over width"""
-        fitted_words = []
-        current_chars = 0
-        
-        for i, word in enumerate(words):
-            word_chars = len(word.text)
-            
-            # Calculate total characters including space
-            total_chars = current_chars + word_chars
-            
-            if fitted_words:
-                total_chars += 1  # Count the space
-            
-            # Check CHARACTER limit FIRST (this is the primary constraint)
-            from .config import text_config
-            if total_chars <= text_config.max_chars_per_line:
-                fitted_words.append(word)
-                current_chars = total_chars
-            else:
-                # Character limit exceeded
-                return fitted_words, words[i:]
+        if skipped_words:
+            print(f"Warning: Skipping {len(skipped_words)} word(s) - too long for line: {skipped_words}")
         
-        return fitted_words, []
+        return lines
     
-    def get_word_style_params(self, word: ProcessedWord, base_style: TextStyle) -> Dict[str, Any]:
-        """Get effective style parameters for a word"""
+    def get_word_style_params(self, words: WordBatch, index: int, base_style: TextStyle) -> Dict[str, Any]:
+        """Get effective style parameters for the word at ``index``"""
         params = {
             'bias': base_style.bias,
             'style': base_style.style,
@@ -196,6 +209,8 @@ class TextProcessor:
         }
         
         # Apply word-specific overrides
-        params.update(word.style_overrides)
+        overrides = words.style_overrides[index]
+        if overrides:
+            params.update(overrides)
         
         return params
\ No newline at end of file
@@ -3,7 +3,8 @@ from collections import defaultdict
 
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.signal import savgol_filter
+from scipy.ndimage import convolve1d
+from scipy.signal import savgol_coeffs
 from scipy.interpolate import interp1d
 
 
@@ -20,9 +21,17 @@ alphabet_ord = list(map(ord, alphabet))
 alpha_to_num = defaultdict(int, list(map(reversed, enumerate(alphabet))))
 num_to_alpha = dict(enumerate(alphabet_ord))
 
+# byte -> alphabet index; characters outside the alphabet map to 0 ('\x00')
+alphabet_lut = np.zeros(256, dtype=np.int64)
+alphabet_lut[alphabet_ord] = np.arange(len(alphabet))
+
 MAX_STROKE_LEN = 1200
 MAX_CHAR_LEN = 75
 
+# savitzky-golay smoothing used by denoise (window 7, cubic)
+SAVGOL_HALF_WINDOW = 3
+SAVGOL_COEFFS = savgol_coeffs(2*SAVGOL_HALF_WINDOW + 1, 3)
+
 
 def align(coords):
     """
@@ -74,7 +83,11 @@ def encode_ascii(ascii_string):
     """
     encodes ascii string to array of ints
     """
-    return np.array(list(map(lambda x: alpha_to_num[x], ascii_string)) + [0])
+    codes = np.frombuffer(ascii_string.encode('utf-32-le'), dtype=np.uint32)
+    # code points past the table all land on 255, which is not in the alphabet
+    encoded = np.zeros(len(codes) + 1, dtype=np.int64)
+    encoded[:-1] = alphabet_lut[np.minimum(codes, 255)]
+    return encoded
 
 # Create a reverse mapping dictionary
 num_to_alpha = {v: k for k, v in alpha_to_num.items()}
@@ -89,17 +102,22 @@ def denoise(coords):
     """
     smoothing filter to mitigate some artifacts of the data collection
     """
-    coords = np.split(coords, np.where(coords[:, 2] == 1)[0] + 1, axis=0)
-    new_coords = []
-    for stroke in coords:
-        if len(stroke) != 0:
-            x_new = savgol_filter(stroke[:, 0], 7, 3, mode='nearest')
-            y_new = savgol_filter(stroke[:, 1], 7, 3, mode='nearest')
-            xy_coords = np.hstack([x_new.reshape(-1, 1), y_new.reshape(-1, 1)])
-            stroke = np.concatenate([xy_coords, stroke[:, 2].reshape(-1, 1)], axis=1)
-            new_coords.append(stroke)
+    # each stroke is filtered on its own with 'nearest' edges, so pad every
+    # stroke with copies of its end points and filter all strokes in one call
+    ends = np.where(coords[:, 2] == 1)[0] + 1
+    starts = np.concatenate([[0], ends])
+    ends = np.concatenate([ends, [len(coords)]])
+    nonempty = ends > starts
+    starts, lengths = starts[nonempty], (ends - starts)[nonempty]
 
-    coords = np.vstack(new_coords)
+    padded = lengths + 2*SAVGOL_HALF_WINDOW
+    position = np.arange(padded.sum()) - np.repeat(np.cumsum(padded) - padded + SAVGOL_HALF_WINDOW, padded)
+    lengths = np.repeat(lengths, padded)
+    index = np.clip(position, 0, lengths - 1) + np.repeat(starts, padded)
+
+    smoothed = convolve1d(coords[index, :2], SAVGOL_COEFFS, axis=0, mode='nearest')
+    coords = np.copy(coords)
+    coords[:, :2] = smoothed[(position >= 0) & (position < lengths)]
     return coords
 
 
@@ -183,17 +201,9 @@ def draw(
 
     fig, ax = plt.subplots(figsize=(12, 3))
 
-    stroke = []
-    for x, y, eos in strokes:
-        stroke.append((x, y))
-        if eos == 1:
-            coords = zip(*stroke)
-            ax.plot(coords[0], coords[1], 'k')
-            stroke = []
-    if stroke:
-        coords = zip(*stroke)
-        ax.plot(coords[0], coords[1], 'k')
-        stroke = []
+    for stroke in np.split(strokes, np.where(strokes[:, 2] == 1)[0] + 1, axis=0):
+        if len(stroke) > 0:
+            ax.plot(stroke[:, 0], stroke[:, 1], 'k')
 
     ax.set_xlim(-50, 600)
     ax.set_ylim(-40, 40)
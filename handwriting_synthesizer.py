@@ -5,25 +5,28 @@ and Flask-based online editing capabilities with SVG viewer.
 
 import re
 import json
+from hashlib import blake2b
 import os
 import copy
+import shutil
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterator
 from dataclasses import dataclass, asdict, replace
 from enum import Enum
-from flask import Flask, render_template, request, jsonify, send_file, session, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_file, session, send_from_directory
 from flask_socketio import SocketIO, emit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import threading
 import uuid
 import time
 
 from core.config import (
     document_config, rnn_config, text_config, PREDEFINED_STYLES,
-    TextAlignment, PageType, TextStyle, PageMargins
+    TextAlignment, PageType, PAGE_TYPES, TextStyle, PageMargins, style_variant
 )
-from core.text_processor import TextProcessor
+from core.text_processor import TextProcessor, word_char_ends, fit_words_to_line
 from core.handwriting_engine import HandwritingEngine
-from core.document_renderer import DocumentRenderer
+from core.document_renderer import DocumentRenderer, LineLayout, WordLayout
 
 class WordRegenerationManager:
     """Manages word-specific regeneration with custom parameters"""
@@ -63,161 +66,148 @@ class WordRegenerationManager:
         if word in self.word_overrides:
             del self.word_overrides[word]
 
+# Markup patterns are compiled once at import. _MARKUP_TOKEN_RE alternates over
+# every block-level markup type so a document is tokenized in one pass.
+_MARKUP_TOKEN_RE = re.compile(
+    r'(?P<page_break>\[page-break\])'
+    r'|(?P<line_break>\[line-break\])'
+    r'|\[style:(?P<style_name>\w+)\](?P<style_body>.*?)\[/style\]'
+    r'|\[align:(?P<align_name>\w+)\](?P<align_body>.*?)\[/align\]'
+    r'|\[bias:(?P<bias_value>[\d.]+)\](?P<bias_body>.*?)\[/bias\]'
+    r'|\[margin:(?P<margin_params>[^\]]+)\](?P<margin_body>.*?)\[/margin\]',
+    re.DOTALL | re.IGNORECASE
+)
+_WORD_RE = re.compile(r'\[word:([^\]]+)\](\w+)\[/word\]')
+_ANY_TAG_RE = re.compile(r'\[[^\]\n]*\]')  # same as \[.*?\] without backtracking
+
+# Caches live outside output/, which the web app serves to clients
+CACHE_DIR = 'cache'
+# Generated word strokes are kept here between runs
+WORD_CACHE_PATH = os.path.join(CACHE_DIR, 'word_cache.npz')
+# Content hash -> result of every synthesized document still on disk, with the
+# (mtime, size) its SVG had when written
+DOCUMENT_INDEX_PATH = os.path.join(CACHE_DIR, 'doc_index.json')
+# Part of every document key; bump it when the rendered output changes, so older entries stop matching
+DOCUMENT_INDEX_VERSION = 2
+
+def _iter_markup_matches(text: str) -> Iterator[re.Match]:
+    """
+    Yield the _MARKUP_TOKEN_RE matches in text, exactly as finditer would.
+    
+    Every markup token starts with '[', so candidate positions are located with
+    str.find and the pattern is only tried there, instead of stepping the regex
+    engine through every character of plain prose.
+    """
+    pos = text.find('[')
+    while pos != -1:
+        match = _MARKUP_TOKEN_RE.match(text, pos)
+        if match:
+            yield match
+            pos = text.find('[', match.end())
+        else:
+            pos = text.find('[', pos + 1)
+
 class EnhancedMarkupProcessor:
     """Enhanced markup processor using the new config system"""
     
-    def __init__(self):
-        self.patterns = {
-            'style': r'\[style:(\w+)\](.*?)\[/style\]',
-            'align': r'\[align:(\w+)\](.*?)\[/align\]', 
-            'bias': r'\[bias:([\d.]+)\](.*?)\[/bias\]',
-            'word': r'\[word:([^\]]+)\](\w+)\[/word\]',
-            'page_break': r'\[page-break\]',
-            'line_break': r'\[line-break\]',
-            'margin': r'\[margin:([^\]]+)\](.*?)\[/margin\]',
-        }
-    
     def preview_markup(self, text: str) -> List[Dict]:
         """Preview markup structure for the web interface"""
         preview = []
-        remaining_text = text
         
-        while remaining_text.strip():
-            # Check for page/line breaks
-            page_break_match = re.match(self.patterns['page_break'], remaining_text)
-            if page_break_match:
+        for block_info in self.tokenize(text):
+            if block_info.get('type') == 'page_break':
                 preview.append({'type': 'break', 'text': '[PAGE_BREAK]'})
-                remaining_text = remaining_text[page_break_match.end():].strip()
                 continue
-                
-            line_break_match = re.match(self.patterns['line_break'], remaining_text)
-            if line_break_match:
+            if block_info.get('type') == 'line_break':
                 preview.append({'type': 'break', 'text': '[LINE_BREAK]'})
-                remaining_text = remaining_text[line_break_match.end():].strip()
                 continue
             
-            # Extract text block with style
-            block_info, remaining_text = self._extract_block_info(remaining_text)
+            custom_words = self._extract_custom_words(block_info['text'])
             
-            if block_info:
-                custom_words = self._extract_custom_words(block_info['text'])
-                
-                preview.append({
-                    'type': 'text',
-                    'text': self._clean_text_for_preview(block_info['text']),
-                    'style': {
-                        'alignment': block_info['style'].alignment.value,
-                        'bias': block_info['style'].bias,
-                        'style': block_info['style'].style, 
-                        'font_scale': block_info['style'].scale,
-                        'font_size': block_info['style'].font_size
-                    },
-                    'custom_words': custom_words,
-                    'margins': block_info.get('margins', {})
-                })
-            else:
-                break
+            preview.append({
+                'type': 'text',
+                'text': self._clean_text_for_preview(block_info['text']),
+                'style': {
+                    'alignment': block_info['style'].alignment.value,
+                    'bias': block_info['style'].bias,
+                    'style': block_info['style'].style, 
+                    'font_scale': block_info['style'].scale,
+                    'font_size': block_info['style'].font_size
+                },
+                'custom_words': custom_words,
+                'margins': block_info.get('margins', {})
+            })
                 
         return preview
     
-    def _extract_block_info(self, text: str) -> Tuple[Optional[Dict], str]:
-        """Extract block information with style and margins"""
-        text = text.strip()
-        if not text:
-            return None, ""
-        
-        # Check for style blocks
-        style_match = re.match(self.patterns['style'], text, re.DOTALL | re.IGNORECASE)
-        if style_match:
-            style_name = style_match.group(1).lower()
-            content = style_match.group(2).strip()
-            remaining = text[style_match.end():].strip()
+    def tokenize(self, text: str) -> Iterator[Dict]:
+        """
+        Split markup into blocks in a single pass over the text.
+        
+        Yields {'type': 'page_break'} and {'type': 'line_break'} markers, and
+        block dicts with 'text' and 'style' (plus 'style_name' or 'margins').
+        Text outside any markup becomes body-style blocks.
+        """
+        last_end = 0
+        
+        for match in _iter_markup_matches(text):
+            # Add text before the markup (if any)
+            before_text = text[last_end:match.start()].strip()
+            if before_text:
+                yield {'text': before_text, 'style': PREDEFINED_STYLES['body']}
+            last_end = match.end()
             
-            if style_name in PREDEFINED_STYLES:
-                # Create a copy of the predefined style using replace()
-                style = replace(PREDEFINED_STYLES[style_name])
+            match_type = match.lastgroup
+            if match_type in ('page_break', 'line_break'):
+                yield {'type': match_type}
             else:
-                style = replace(PREDEFINED_STYLES['body'])  # default
-                
+                yield self._block_from_match(match)
+        
+        # No more markup, process remaining text as body
+        remaining_text = text[last_end:].strip()
+        if remaining_text:
+            yield {'text': remaining_text, 'style': PREDEFINED_STYLES['body']}
+    
+    def _block_from_match(self, match: re.Match) -> Dict:
+        """Build block information for a style, align, bias or margin match"""
+        match_type = match.lastgroup
+        
+        if match_type == 'style_body':
+            style_name = match.group('style_name').lower()
+            # Styles are frozen, so the predefined instance can be shared
+            style = PREDEFINED_STYLES.get(style_name, PREDEFINED_STYLES['body'])
             return {
-                'text': content,
+                'text': match.group('style_body').strip(),
                 'style': style,
                 'style_name': style_name
-            }, remaining
-        
-        # Check for alignment blocks
-        align_match = re.match(self.patterns['align'], text, re.DOTALL | re.IGNORECASE)
-        if align_match:
-            align_name = align_match.group(1).upper()
-            content = align_match.group(2).strip()
-            remaining = text[align_match.end():].strip()
-            
+            }
+        
+        if match_type == 'align_body':
             try:
-                alignment = TextAlignment(align_name)
-                # Create new TextStyle with custom alignment
-                base_style = PREDEFINED_STYLES['body']
-                style = replace(base_style, alignment=alignment)
+                alignment = TextAlignment(match.group('align_name').upper())
+                # Body style with custom alignment (shared per alignment)
+                style = style_variant(PREDEFINED_STYLES['body'], alignment=alignment)
             except ValueError:
-                style = replace(PREDEFINED_STYLES['body'])
-                
+                style = PREDEFINED_STYLES['body']
             return {
-                'text': content,
+                'text': match.group('align_body').strip(),
                 'style': style
-            }, remaining
-        
-        # Check for bias blocks
-        bias_match = re.match(self.patterns['bias'], text, re.DOTALL | re.IGNORECASE)
-        if bias_match:
-            bias_val = float(bias_match.group(1))
-            content = bias_match.group(2).strip()
-            remaining = text[bias_match.end():].strip()
-            
-            # Create new TextStyle with custom bias
-            base_style = PREDEFINED_STYLES['body']
-            style = replace(base_style, bias=bias_val)
-            
+            }
+        
+        if match_type == 'bias_body':
+            # Body style with custom bias (shared per bias value)
+            style = style_variant(PREDEFINED_STYLES['body'], bias=float(match.group('bias_value')))
             return {
-                'text': content,
+                'text': match.group('bias_body').strip(),
                 'style': style
-            }, remaining
-        
-        # Check for margin blocks
-        margin_match = re.match(self.patterns['margin'], text, re.DOTALL | re.IGNORECASE)
-        if margin_match:
-            margin_params = margin_match.group(1)
-            content = margin_match.group(2).strip()
-            remaining = text[margin_match.end():].strip()
-            
-            margins = self._parse_margin_params(margin_params)
-            style = replace(PREDEFINED_STYLES['body'])
-            
-            return {
-                'text': content,
-                'style': style,
-                'margins': margins
-            }, remaining
-        
-        # No markup found, extract paragraph until next markup
-        next_markup_pos = float('inf')
-        for pattern in self.patterns.values():
-            match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-            if match:
-                next_markup_pos = min(next_markup_pos, match.start())
-        
-        if next_markup_pos == float('inf'):
-            # No more markup, return all remaining text
-            return {
-                'text': text,
-                'style': replace(PREDEFINED_STYLES['body'])
-            }, ""
-        else:
-            # Return text up to next markup
-            content = text[:next_markup_pos].strip()
-            remaining = text[next_markup_pos:].strip()
-            return {
-                'text': content,
-                'style': replace(PREDEFINED_STYLES['body'])
-            }, remaining
+            }
+        
+        # Margin block
+        return {
+            'text': match.group('margin_body').strip(),
+            'style': PREDEFINED_STYLES['body'],
+            'margins': self._parse_margin_params(match.group('margin_params'))
+        }
     
     def _parse_margin_params(self, params_str: str) -> Dict[str, float]:
         """Parse margin parameters from string"""
@@ -232,7 +222,7 @@ class EnhancedMarkupProcessor:
         """Extract custom word parameters from text"""
         custom_words = {}
         
-        for match in re.finditer(self.patterns['word'], text):
+        for match in _WORD_RE.finditer(text):
             params_str = match.group(1)
             word = match.group(2)
             
@@ -256,15 +246,16 @@ class EnhancedMarkupProcessor:
         """Clean markup tags from text for preview"""
         clean_text = text
         # Remove word tags
-        clean_text = re.sub(self.patterns['word'], r'\2', clean_text)
+        clean_text = _WORD_RE.sub(r'\2', clean_text)
         return clean_text.strip()
 
 class AdvancedHandwritingSynthesizer:
     """Advanced synthesizer with enhanced config system"""
     
-    def __init__(self, checkpoint_dir: str = 'checkpoints'):
+    def __init__(self, checkpoint_dir: str = 'checkpoints', use_xla: bool = False):
         self.text_processor = TextProcessor()
-        self.handwriting_engine = HandwritingEngine(checkpoint_dir)
+        self.handwriting_engine = HandwritingEngine(checkpoint_dir, use_xla=use_xla)
+        self.handwriting_engine.load_cache(WORD_CACHE_PATH)
         self.document_renderer = DocumentRenderer()
         self.markup_processor = EnhancedMarkupProcessor()
         self.word_manager = WordRegenerationManager()
@@ -277,6 +268,110 @@ class AdvancedHandwritingSynthesizer:
         self.current_margins = None
         self.current_output_name = ""
         
+        # Output directories already ensured, so repeat syntheses skip the mkdir
+        self._created_dirs: Set[str] = set()
+        
+        self._document_index: Dict[str, Dict[str, Any]] = self._load_document_index()
+        
+    def close(self):
+        """Save generated strokes for the next run and release the model"""
+        self.handwriting_engine.save_cache(WORD_CACHE_PATH)
+        self.handwriting_engine.close()
+        
+    @staticmethod
+    def _svg_signature(svg_filename: str) -> Optional[List[int]]:
+        """Get [mtime, size] of an SVG, which changes whenever it is overwritten; None if it is gone"""
+        try:
+            stat = os.stat(svg_filename)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+    
+    def _load_document_index(self) -> Dict[str, Dict[str, Any]]:
+        """Load the document index, dropping documents whose SVG is gone or was overwritten"""
+        try:
+            with open(DOCUMENT_INDEX_PATH, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return {
+                key: entry for key, entry in index.items()
+                if self._svg_signature(entry['result']['svg_filename']) == entry['svg']
+            }
+        except (FileNotFoundError, ValueError, TypeError, KeyError):
+            return {}
+    
+    def _save_document_index(self):
+        os.makedirs(os.path.dirname(DOCUMENT_INDEX_PATH), exist_ok=True)
+        temp_path = f"{DOCUMENT_INDEX_PATH}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self._document_index, ensure_ascii=False))
+        os.replace(temp_path, DOCUMENT_INDEX_PATH)
+    
+    def _remember_document(self, document_key: str, result: Dict[str, Any]):
+        """Index a finished document, replacing entries whose SVG it overwrote"""
+        svg_filename = result['svg_filename']
+        for key in [key for key, entry in self._document_index.items()
+                    if entry['result']['svg_filename'] == svg_filename]:
+            del self._document_index[key]
+        self._document_index[document_key] = {'result': result, 'svg': self._svg_signature(svg_filename)}
+        self._save_document_index()
+    
+    def document_key(self, markup_text: str, custom_margins: PageMargins = None) -> str:
+        """Hash everything a synthesized document depends on"""
+        engine = self.handwriting_engine
+        content = json.dumps({
+            'version': DOCUMENT_INDEX_VERSION,
+            'markup': markup_text,
+            'margins': asdict(custom_margins or self.doc_config.margins),
+            'layout': {
+                'page': asdict(self.doc_config.page),
+                'num_lines': self.doc_config.num_lines,
+                'line_height': self.doc_config.line_height,
+                'draw_guidelines': self.doc_config.draw_guidelines,
+                'text': asdict(text_config),
+                'rnn': asdict(rnn_config)
+            },
+            'checkpoint': [engine.checkpoint_dir, engine.warm_start_step],
+            'word_overrides': {word: [override['bias'], override['style']]
+                               for word, override in self.word_manager.word_overrides.items()}
+        }, sort_keys=True)
+        return blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+    
+    def reuse_document(self, markup_text: str, custom_margins: PageMargins = None,
+                       output_filename: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the result of an earlier identical synthesis whose SVG is still
+        the file it wrote, unchanged since.
+        
+        If ``output_filename`` names other files, the earlier SVG and metadata
+        are copied there. On a hit the synthesizer is left in the same state
+        synthesizing the document again would leave it in, so word
+        regeneration keeps working.
+        """
+        document_key = self.document_key(markup_text, custom_margins)
+        entry = self._document_index.get(document_key)
+        if entry is None:
+            return None
+        result = entry['result']
+        if self._svg_signature(result['svg_filename']) != entry['svg']:
+            return None
+        
+        if output_filename and f"{output_filename}.svg" != result['svg_filename']:
+            output_dir = os.path.dirname(output_filename) or 'output'
+            if output_dir not in self._created_dirs:
+                os.makedirs(output_dir, exist_ok=True)
+                self._created_dirs.add(output_dir)
+            result = dict(result,
+                          svg_filename=shutil.copyfile(result['svg_filename'], f"{output_filename}.svg"),
+                          metadata_filename=shutil.copyfile(result['metadata_filename'],
+                                                            f"{output_filename}_metadata.json"))
+            self._remember_document(document_key, result)
+        
+        self.current_markup = markup_text
+        self.current_margins = custom_margins
+        self.current_output_name = os.path.splitext(os.path.basename(result['svg_filename']))[0]
+        self.doc_config.margins = PageMargins(**result['metadata']['margins'])
+        return result
+    
     def preview_document(self, markup_text: str) -> List[Dict]:
         """Preview document structure"""
         return self.markup_processor.preview_markup(markup_text)
@@ -288,18 +383,20 @@ class AdvancedHandwritingSynthesizer:
         base_bias = bias or rnn_config.default_bias
         base_style = style or rnn_config.default_style
         
-        for i in range(attempts):
-            # Vary parameters slightly for each attempt
-            attempt_bias = base_bias + (i * 0.2 - 0.2)
-            attempt_style = base_style + (i * 2 - 2)
-            
-            # Clear cache for this specific combination
-            cache_key = f"{word}_{attempt_bias}_{attempt_style}"
-            if hasattr(self.handwriting_engine, '_stroke_cache'):
-                self.handwriting_engine._stroke_cache.pop(cache_key, None)
-            
-            strokes, width = self.handwriting_engine.generate_word_strokes(word, attempt_bias, attempt_style)
-            
+        # Vary parameters slightly for each attempt
+        attempt_biases = [base_bias + (i * 0.2 - 0.2) for i in range(attempts)]
+        attempt_styles = [base_style + (i * 2 - 2) for i in range(attempts)]
+        
+        # Clear cache for these specific combinations, then sample all attempts in one model run
+        for attempt_bias, attempt_style in zip(attempt_biases, attempt_styles):
+            self.handwriting_engine.forget_word(word, attempt_bias, attempt_style)
+        # Documents using the old strokes can no longer be reused
+        if self._document_index:
+            self._document_index.clear()
+            self._save_document_index()
+        results = self.handwriting_engine.generate_words_batch([word] * attempts, attempt_biases, attempt_styles)
+        
+        for i, (attempt_bias, attempt_style, (_, width)) in enumerate(zip(attempt_biases, attempt_styles, results)):
             versions.append({
                 'bias': float(attempt_bias),  # Convert to Python float
                 'style': int(attempt_style),  # Convert to Python int
@@ -334,7 +431,7 @@ class AdvancedHandwritingSynthesizer:
         return {
             'success': True,
             'result': result,
-            'word_overrides': dict(self.word_manager.word_overrides)
+            'word_overrides': self.word_manager.word_overrides.copy()
         }
     
     def synthesize_document_with_markup(self, 
@@ -344,6 +441,8 @@ class AdvancedHandwritingSynthesizer:
                                       progress_callback=None) -> Dict[str, Any]:
         """Synthesize document from markup text using enhanced processor"""
         
+        document_key = self.document_key(markup_text, custom_margins)
+        
         # Store current state for regeneration
         self.current_markup = markup_text
         self.current_margins = custom_margins
@@ -355,7 +454,10 @@ class AdvancedHandwritingSynthesizer:
             output_filename = f"output/document_{timestamp}"
         
         # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_filename) if os.path.dirname(output_filename) else 'output', exist_ok=True)
+        output_dir = os.path.dirname(output_filename) or 'output'
+        if output_dir not in self._created_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+            self._created_dirs.add(output_dir)
         
         if progress_callback:
             progress_callback({'progress': 10, 'message': 'Processing markup text...'})
@@ -404,62 +506,80 @@ class AdvancedHandwritingSynthesizer:
                 self._apply_custom_margins(block_info['margins'])
             
             # Determine page type
-            page_type = PageType.ODD if current_page % 2 == 1 else PageType.EVEN
+            page_type = PAGE_TYPES[current_page & 1]
             
             # Get page-specific margins and text area
             text_area_x, text_area_y, text_area_width, text_area_height = self.doc_config.get_text_area(page_type)
             
             # Process text into words and lines
-            words = re.findall(r'\S+', block_info['text'])
+            words = block_info['text'].split()
+            
+            char_ends = word_char_ends(words)
             
-            # Fit words into lines
-            remaining_words = words
-            while remaining_words and current_line_number < self.doc_config.num_lines:
+            # Fit words into lines, collecting each line's placement and word parameters
+            skipped_words = []
+            block_lines = []
+            line_start = 0
+            while line_start < len(words) and current_line_number < self.doc_config.num_lines:
                 # Fit words to current line
-                fitted_words, remaining_words = self._fit_words_to_line(
-                    remaining_words, text_area_width, block_info['style']
-                )
+                line_end = fit_words_to_line(char_ends, line_start)
                 
-                if not fitted_words:
+                if line_end == line_start:
                     # Skip problematic word
-                    if remaining_words:
-                        print(f"Warning: Skipping word '{remaining_words[0]}' (too long)")
-                        remaining_words = remaining_words[1:]
+                    skipped_words.append(words[line_start])
+                    line_start += 1
                     continue
                 
-                # Generate strokes for words in this line
-                strokes_list = []
-                for word in fitted_words:
-                    # Get effective style parameters
-                    bias = block_info['style'].bias
-                    style_id = block_info['style'].style
-                    
-                    # Check for word-level overrides
-                    bias, style_id = self.word_manager.get_word_parameters(word, bias, style_id)
-                    
-                    # Generate strokes
-                    strokes, _ = self.handwriting_engine.generate_word_strokes(word, bias, style_id)
-                    strokes_list.append(strokes)
+                block_lines.append((line_start, line_end, current_line_number, current_page))
+                line_start = line_end
+                current_line_number += 1
                 
-                # Create line layout
+                # Check if we need a new page
+                if current_line_number >= self.doc_config.num_lines:
+                    current_page += 1
+                    current_line_number = 0
+            
+            # Collect effective style parameters for the fitted words
+            block_words = []
+            biases = []
+            style_ids = []
+            for line_start, line_end, _, _ in block_lines:
+                for word in words[line_start:line_end]:
+                    # Check for word-level overrides
+                    bias, style_id = self.word_manager.get_word_parameters(
+                        word, block_info['style'].bias, block_info['style'].style
+                    )
+                    block_words.append(word)
+                    biases.append(bias)
+                    style_ids.append(style_id)
+            
+            # Generate strokes for the whole block at once, so the engine can
+            # batch words across lines
+            block_strokes = [
+                strokes for strokes, _ in
+                self.handwriting_engine.generate_words_batch(block_words, biases, style_ids)
+            ] if block_words else []
+            
+            # Create line layouts
+            offset = 0
+            for line_start, line_end, line_number, page_number in block_lines:
+                line_length = line_end - line_start
                 line_layout = self._create_simple_line_layout(
-                    word_texts=fitted_words,
-                    strokes_list=strokes_list,
-                    line_number=current_line_number,
+                    word_texts=words[line_start:line_end],
+                    strokes_list=block_strokes[offset:offset + line_length],
+                    line_number=line_number,
                     style=block_info['style'],
                     text_area_x=text_area_x,
                     text_area_y=text_area_y,
                     text_area_width=text_area_width,
-                    page_number=current_page
+                    page_number=page_number
                 )
+                offset += line_length
                 
                 all_line_layouts.append(line_layout)
-                current_line_number += 1
-                
-                # Check if we need a new page
-                if current_line_number >= self.doc_config.num_lines:
-                    current_page += 1
-                    current_line_number = 0
+            
+            if skipped_words:
+                print(f"Warning: Skipping {len(skipped_words)} word(s) (too long): {skipped_words}")
         
         if progress_callback:
             progress_callback({'progress': 80, 'message': 'Rendering document...'})
@@ -476,133 +596,63 @@ class AdvancedHandwritingSynthesizer:
         # Create metadata
         metadata = {
             'timestamp': datetime.now().isoformat(),
-            'total_pages': max(1, (len(all_line_layouts) // self.doc_config.num_lines) + 1),
+            'total_pages': all_line_layouts[-1].page_number if all_line_layouts else 1,
             'total_lines': len(all_line_layouts),
             'margins': asdict(self.doc_config.margins),
-            'word_overrides': dict(self.word_manager.word_overrides),
+            'word_overrides': self.word_manager.word_overrides.copy(),
             'total_blocks': len(processed_blocks)
         }
         
         metadata_filename = f"{output_filename}_metadata.json"
         with open(metadata_filename, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+            # Encode up front so the file gets one write instead of one per JSON chunk
+            f.write(json.dumps(metadata, indent=2, ensure_ascii=False))
         
-        if progress_callback:
-            progress_callback({'progress': 100, 'message': 'Complete!'})
-        
-        return {
+        result = {
             'svg_filename': svg_filename,
             'metadata_filename': metadata_filename,
             'metadata': metadata,
             'line_count': len(all_line_layouts),
             'page_count': metadata['total_pages']
         }
+        self._remember_document(document_key, result)
+        
+        if progress_callback:
+            progress_callback({'progress': 100, 'message': 'Complete!'})
+        
+        return result
     
     def _enhanced_process_markup(self, markup_text: str) -> List[Dict]:
         """Enhanced markup processing with proper break and margin handling"""
-        blocks = []
-        remaining_text = markup_text
-        
-        while remaining_text.strip():
-            # Check for page breaks
-            page_break_match = re.match(r'\[page-break\]', remaining_text)
-            if page_break_match:
-                blocks.append({'type': 'page_break'})
-                remaining_text = remaining_text[page_break_match.end():].strip()
-                continue
-            
-            # Check for line breaks
-            line_break_match = re.match(r'\[line-break\]', remaining_text)
-            if line_break_match:
-                blocks.append({'type': 'line_break'})
-                remaining_text = remaining_text[line_break_match.end():].strip()
-                continue
-            
-            # Extract regular text blocks
-            block_info, remaining_text = self.markup_processor._extract_block_info(remaining_text)
-            
-            if block_info:
-                blocks.append(block_info)
-            else:
-                # No more markup, add remaining text as body style
-                if remaining_text.strip():
-                    blocks.append({
-                        'text': remaining_text.strip(),
-                        'style': replace(PREDEFINED_STYLES['body'])
-                    })
-                break
-        
-        return blocks
+        return list(self.markup_processor.tokenize(markup_text))
     
     def _apply_custom_margins(self, margins: Dict[str, float]):
         """Apply custom margins to document config"""
-        current_margins = asdict(self.doc_config.margins)
-        current_margins.update(margins)
-        self.doc_config.margins = PageMargins(**current_margins)
+        self.doc_config.margins = replace(self.doc_config.margins, **margins)
     
     def _simple_process_markup(self, markup_text: str) -> List[Dict]:
         """Simple markup processing that creates blocks with styles"""
-        blocks = []
-        remaining_text = markup_text
-        
-        while remaining_text.strip():
-            block_info, remaining_text = self.markup_processor._extract_block_info(remaining_text)
-            
-            if block_info:
-                blocks.append(block_info)
-            else:
-                # No more markup, add remaining text as body style
-                if remaining_text.strip():
-                    blocks.append({
-                        'text': remaining_text.strip(),
-                        'style': replace(PREDEFINED_STYLES['body'])
-                    })
-                break
-        
-        return blocks
+        # Breaks are not handled here, so only styled text blocks are kept
+        return [
+            block_info for block_info in self.markup_processor.tokenize(markup_text)
+            if 'type' not in block_info
+        ]
     
     def _fallback_process_text(self, markup_text: str) -> List[Dict]:
         """Fallback text processing if everything else fails"""
         # Remove all markup and treat as plain text
-        clean_text = re.sub(r'\[.*?\]', '', markup_text)
+        clean_text = _ANY_TAG_RE.sub('', markup_text)
         
         return [{
             'text': clean_text.strip(),
-            'style': replace(PREDEFINED_STYLES['body'])
+            'style': PREDEFINED_STYLES['body']
         }]
     
-    def _fit_words_to_line(self, words: List[str], max_width: float, style: TextStyle) -> Tuple[List[str], List[str]]:
-        """Fit words to a line prioritizing CHARACTER limit over width limit"""
-        fitted_words = []
-        current_chars = 0
-        
-        for i, word in enumerate(words):
-            word_chars = len(word)
-            
-            # Calculate total characters including space
-            total_chars = current_chars + word_chars
-            
-            if fitted_words:  # Add space if not first word
-                total_chars += 1  # Count the space character
-            
-            # PRIORITIZE character limit - check this FIRST
-            if total_chars <= text_config.max_chars_per_line:
-                fitted_words.append(word)
-                current_chars = total_chars
-            else:
-                # Character limit exceeded - return what we have
-                return fitted_words, words[i:]
-        
-        # All words fit within character limit
-        return fitted_words, []
-    
     def _create_simple_line_layout(self, word_texts, strokes_list, line_number, style, 
                                 text_area_x, text_area_y, text_area_width, page_number=1):
         """Create line layout using simple positioning"""
-        from core.document_renderer import LineLayout, WordLayout, PageType
-        
         # Determine page type - THIS IS CRITICAL
-        page_type = PageType.ODD if page_number % 2 == 1 else PageType.EVEN
+        page_type = PAGE_TYPES[page_number & 1]
         
         # RECALCULATE text area for this specific page type
         actual_text_area_x, actual_text_area_y, actual_text_area_width, actual_text_area_height = self.doc_config.get_text_area(page_type)
@@ -614,27 +664,27 @@ class AdvancedHandwritingSynthesizer:
         y_position = actual_text_area_y + (line_within_page * self.doc_config.line_height)
         
         # Calculate word positions using the correct text area
-        word_positions = self._calculate_simple_word_positions(
+        word_positions, word_widths = self._calculate_simple_word_positions(
             word_texts, strokes_list, style.alignment, actual_text_area_width, actual_text_area_x, style
         )
         
         # Create word layouts
         word_layouts = []
-        for word_text, strokes, x_pos in zip(word_texts, strokes_list, word_positions):
-            word_width = self._calculate_stroke_width(strokes) if len(strokes) > 0 else 0
-            
-            # Apply style scaling
-            scaled_strokes = strokes.copy() if len(strokes) > 0 else strokes
-            if len(scaled_strokes) > 0:
-                scaled_strokes[:, :2] *= style.scale
+        for word_text, strokes, x_pos, word_width in zip(word_texts, strokes_list, word_positions, word_widths):
+            # Words without strokes were only estimated for positioning
+            if len(strokes) == 0:
+                word_width = 0
             
+            # Style scaling is applied at render time, so the cached strokes
+            # are used as they are instead of being copied per word
             word_layouts.append(WordLayout(
                 text=word_text,
-                strokes=scaled_strokes,
+                strokes=strokes,
                 x_position=x_pos,
                 y_position=y_position,
-                width=word_width * style.scale,
-                page_number=page_number
+                width=word_width,
+                page_number=page_number,
+                scale=style.scale
             ))
         
         return LineLayout(
@@ -648,7 +698,7 @@ class AdvancedHandwritingSynthesizer:
     
     def _calculate_simple_word_positions(self, word_texts, strokes_list, alignment, 
                                        text_area_width, text_area_x, style):
-        """Calculate word positions with simple logic"""
+        """Calculate word positions with simple logic, along with the scaled word widths used"""
         positions = []
         space_width = style.font_width * 0.3
         
@@ -665,39 +715,29 @@ class AdvancedHandwritingSynthesizer:
         total_space_width = (len(word_widths) - 1) * space_width if len(word_widths) > 1 else 0
         total_content_width = total_word_width + total_space_width
         
+        # Alignment only decides where the line starts and how wide the gaps are
+        gap = space_width
         if alignment == TextAlignment.LEFT:
-            x_pos = text_area_x
-            for word_width in word_widths:
-                positions.append(x_pos)
-                x_pos += word_width + space_width
-                
+            start_x = text_area_x
         elif alignment == TextAlignment.RIGHT:
             start_x = text_area_x + text_area_width - total_content_width
-            x_pos = max(text_area_x, start_x)  # Don't go beyond left edge
-            for word_width in word_widths:
-                positions.append(x_pos)
-                x_pos += word_width + space_width
-                
+            start_x = max(text_area_x, start_x)  # Don't go beyond left edge
         elif alignment == TextAlignment.CENTER:
             start_x = text_area_x + (text_area_width - total_content_width) / 2
-            x_pos = max(text_area_x, start_x)  # Don't go beyond left edge
-            for word_width in word_widths:
-                positions.append(x_pos)
-                x_pos += word_width + space_width
-                
+            start_x = max(text_area_x, start_x)  # Don't go beyond left edge
         elif alignment == TextAlignment.JUSTIFY:
-            if len(word_widths) == 1:
-                positions.append(text_area_x)
-            else:
-                available_space = text_area_width - total_word_width
-                space_between_words = available_space / (len(word_widths) - 1) if len(word_widths) > 1 else 0
-                
-                x_pos = text_area_x
-                for word_width in word_widths:
-                    positions.append(x_pos)
-                    x_pos += word_width + space_between_words
+            start_x = text_area_x
+            if len(word_widths) > 1:
+                gap = (text_area_width - total_word_width) / (len(word_widths) - 1)
+        else:
+            return positions, word_widths
+        
+        x_pos = start_x
+        for word_width in word_widths:
+            positions.append(x_pos)
+            x_pos += word_width + gap
         
-        return positions
+        return positions, word_widths
     
     def _calculate_stroke_width(self, strokes):
         """Calculate width of stroke array"""
@@ -713,6 +753,72 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # Global synthesizer instance
 synthesizer = None
 active_tasks = {}
+# Finished tasks are dropped this many seconds after finishing; their
+# documents stay in output/
+TASK_TTL = 3600
+# Finished task id -> expiry time, in finishing order. Expired ids stay listed
+# without their task, so /api/task can answer 410 Gone for them, until the
+# oldest entries are evicted to keep at most MAX_FINISHED_TASKS
+_task_expiry: Dict[str, float] = {}
+MAX_FINISHED_TASKS = 1024
+tasks_lock = threading.RLock()
+# The synthesizer keeps per-document state and one model session, so all work
+# using it runs on a single worker, in request order
+synthesis_pool = ThreadPoolExecutor(max_workers=1)
+_pool_jobs = 0  # Jobs submitted to synthesis_pool and not finished yet; guarded by tasks_lock
+# Requests beyond this many unfinished jobs are turned away with 429
+MAX_POOL_JOBS = 16
+# Seconds a request waits for its job's result before answering 504
+JOB_RESULT_TIMEOUT = 600
+# Metadata file path -> (mtime, fields listed by /api/documents)
+_document_metadata_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+def _finish_task(task_id: str, task: Dict[str, Any]):
+    """Record a task's final state and start its expiry countdown"""
+    with tasks_lock:
+        active_tasks[task_id] = task
+        _task_expiry[task_id] = time.monotonic() + TASK_TTL
+        while len(_task_expiry) > MAX_FINISHED_TASKS:
+            oldest_id = next(iter(_task_expiry))
+            del _task_expiry[oldest_id]
+            active_tasks.pop(oldest_id, None)
+
+def _prune_expired_tasks():
+    """Drop finished tasks past their TTL, keeping their ids; call with tasks_lock held"""
+    now = time.monotonic()
+    # Every task gets the same TTL, so expiry times are in insertion order
+    for task_id, expiry in _task_expiry.items():
+        if expiry > now:
+            break
+        active_tasks.pop(task_id, None)
+
+class SynthesisQueueFull(RuntimeError):
+    """Raised when synthesis_pool already has MAX_POOL_JOBS unfinished jobs"""
+
+def _synthesis_job_done(future):
+    """Stop counting a synthesis_pool job once it has finished or was cancelled"""
+    global _pool_jobs
+    with tasks_lock:
+        _pool_jobs -= 1
+
+def _submit_synthesis_job(fn, *args):
+    """Queue work on synthesis_pool, counting it until it finishes or is cancelled"""
+    global _pool_jobs
+    with tasks_lock:
+        if _pool_jobs >= MAX_POOL_JOBS:
+            raise SynthesisQueueFull(f'{_pool_jobs} synthesis jobs are already waiting, try again later')
+        _pool_jobs += 1
+        future = synthesis_pool.submit(fn, *args)
+    future.add_done_callback(_synthesis_job_done)
+    return future
+
+def _job_result(future):
+    """Wait for a synthesis job; one that has not started by the timeout is cancelled"""
+    try:
+        return future.result(timeout=JOB_RESULT_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
 
 # Built-in templates
 TEMPLATES = {
@@ -837,12 +943,8 @@ def api_preview():
         
         preview = synthesizer.preview_document(markup_text)
         
-        # Count words
-        word_count = 0
-        for block in preview:
-            if block['type'] == 'text':
-                words = block['text'].split()
-                word_count += len(words)
+        # Count words with one split over all text blocks
+        word_count = len(' '.join(block['text'] for block in preview if block['type'] == 'text').split())
         
         return jsonify({
             'success': True,
@@ -864,7 +966,7 @@ def api_apply_word_regeneration():
         if not all([word, bias is not None, style is not None]):
             return jsonify({'success': False, 'error': 'Missing parameters'}), 400
         
-        result = synthesizer.apply_word_regeneration(word, float(bias), int(style))
+        result = _job_result(_submit_synthesis_job(synthesizer.apply_word_regeneration, word, float(bias), int(style)))
         
         if result['success']:
             # Extract just the filename without path for the viewer
@@ -874,6 +976,10 @@ def api_apply_word_regeneration():
         
         return jsonify(result)
         
+    except SynthesisQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except FutureTimeoutError:
+        return jsonify({'success': False, 'error': 'Timed out waiting for the synthesis worker'}), 504
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -900,41 +1006,71 @@ def api_synthesize():
         
         task_id = str(uuid.uuid4())
         
+        # Identical documents are served from the earlier result without a synthesis
+        # run. The check is only made here when the pool is idle; submitted under
+        # the lock it then runs first, so this request never waits behind other
+        # work. Otherwise it waits its turn in process_document.
+        reuse = None
+        with tasks_lock:
+            _prune_expired_tasks()
+            # Jobs queued or running ahead of this one, word regenerations included
+            queue_position = _pool_jobs
+            if not queue_position:
+                reuse = _submit_synthesis_job(synthesizer.reuse_document, markup_text, custom_margins,
+                                              f"output/{output_name}")
+        
+        result = _job_result(reuse) if reuse is not None else None
+        if result is not None:
+            svg_filename = os.path.basename(result['svg_filename'])
+            completed_task = {
+                'status': 'completed',
+                'progress': 100,
+                'message': 'Synthesis complete!',
+                'result': result,
+                'svg_filename': svg_filename,
+                'viewer_url': f'/viewer/{svg_filename}'
+            }
+            _finish_task(task_id, completed_task)
+            return jsonify({'success': True, 'task_id': task_id, **completed_task})
+        
         # Store task data
-        active_tasks[task_id] = {
+        queued_task = {
             'status': 'processing',
             'progress': 0,
-            'message': 'Starting synthesis...'
+            'message': f'Waiting for {queue_position} earlier job(s)...' if queue_position else 'Starting synthesis...',
+            'queue_position': queue_position
         }
-        
         def process_document():
             try:
                 def progress_callback(update):
-                    active_tasks[task_id].update(update)
+                    with tasks_lock:
+                        active_tasks[task_id].update(update)
                     socketio.emit('synthesis_update', {
                         'task_id': task_id,
                         'status': 'processing',
                         **update
                     })
                 
-                result = synthesizer.synthesize_document_with_markup(
-                    markup_text=markup_text,
-                    custom_margins=custom_margins,
-                    output_filename=f"output/{output_name}",
-                    progress_callback=progress_callback
-                )
+                result = synthesizer.reuse_document(markup_text, custom_margins, f"output/{output_name}")
+                if result is None:
+                    result = synthesizer.synthesize_document_with_markup(
+                        markup_text=markup_text,
+                        custom_margins=custom_margins,
+                        output_filename=f"output/{output_name}",
+                        progress_callback=progress_callback
+                    )
                 
                 # Extract just the filename without path for the viewer
                 svg_filename = os.path.basename(result['svg_filename'])
                 
-                active_tasks[task_id] = {
+                _finish_task(task_id, {
                     'status': 'completed',
                     'progress': 100,
                     'message': 'Synthesis complete!',
                     'result': result,
                     'svg_filename': svg_filename,
                     'viewer_url': f'/viewer/{svg_filename}'
-                }
+                })
                 
                 socketio.emit('synthesis_update', {
                     'task_id': task_id,
@@ -950,11 +1086,11 @@ def api_synthesize():
                 error_msg = f'Error: {str(e)}'
                 print(f"Synthesis error: {e}")
                 
-                active_tasks[task_id] = {
+                _finish_task(task_id, {
                     'status': 'error',
                     'progress': 0,
                     'message': error_msg
-                }
+                })
                 
                 socketio.emit('synthesis_update', {
                     'task_id': task_id,
@@ -963,13 +1099,36 @@ def api_synthesize():
                     'message': error_msg
                 })
         
-        threading.Thread(target=process_document).start()
+        # Registered under the lock, so the task exists before process_document can update it
+        with tasks_lock:
+            _submit_synthesis_job(process_document)
+            active_tasks[task_id] = dict(queued_task)
         
-        return jsonify({'success': True, 'task_id': task_id})
+        return jsonify({'success': True, 'task_id': task_id, **queued_task})
         
+    except SynthesisQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except FutureTimeoutError:
+        return jsonify({'success': False, 'error': 'Timed out waiting for the synthesis worker'}), 504
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/task/<task_id>')
+def api_task_status(task_id):
+    """Get the state of a synthesis task"""
+    with tasks_lock:
+        _prune_expired_tasks()
+        task = active_tasks.get(task_id)
+        if task is not None:
+            task = dict(task)
+        expired = task_id in _task_expiry
+    
+    if task is None:
+        if expired:
+            return jsonify({'error': 'Task expired'}), 410
+        return jsonify({'error': 'Unknown task'}), 404
+    return jsonify({'task_id': task_id, **task})
+
 @app.route('/api/regenerate_word', methods=['POST'])
 def api_regenerate_word():
     try:
@@ -979,54 +1138,96 @@ def api_regenerate_word():
         style = data.get('style')
         attempts = data.get('attempts', 3)
         
-        versions = synthesizer.regenerate_word_multiple(word, bias, style, attempts)
+        versions = _job_result(_submit_synthesis_job(synthesizer.regenerate_word_multiple, word, bias, style, attempts))
         
         return jsonify({
             'success': True,
             'versions': versions
         })
         
+    except SynthesisQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except FutureTimeoutError:
+        return jsonify({'success': False, 'error': 'Timed out waiting for the synthesis worker'}), 504
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/documents')
-def api_list_documents():
-    """List all generated documents"""
+def _document_metadata_summary(entry: os.DirEntry) -> Dict[str, Any]:
+    """Get the listed fields of a metadata file, parsing it again only once it changes"""
+    mtime = entry.stat().st_mtime_ns
+    cached = _document_metadata_cache.get(entry.path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
     try:
-        output_dir = 'output'
-        if not os.path.exists(output_dir):
-            return jsonify({'documents': []})
-        
-        documents = []
-        for filename in os.listdir(output_dir):
-            if filename.endswith('.svg'):
-                file_path = os.path.join(output_dir, filename)
-                metadata_path = file_path.replace('.svg', '_metadata.json')
-                
+        with open(entry.path, 'r') as f:
+            metadata = json.load(f)
+        summary = {
+            'total_pages': metadata.get('total_pages', 1),
+            'total_lines': metadata.get('total_lines', 0),
+            'timestamp': metadata.get('timestamp')
+        }
+    except:
+        summary = {}
+    
+    _document_metadata_cache[entry.path] = (mtime, summary)
+    return summary
+
+def _iter_documents(output_dir: str) -> Iterator[Dict[str, Any]]:
+    """Yield the listing entry of each document in output_dir, in directory order"""
+    # One directory scan; on Linux each entry's stat needs at most one syscall
+    with os.scandir(output_dir) as it:
+        entries = {entry.name: entry for entry in it}
+    
+    # Forget metadata of files that are gone
+    scanned_paths = {entry.path for entry in entries.values()}
+    for path in list(_document_metadata_cache):
+        if path not in scanned_paths:
+            _document_metadata_cache.pop(path, None)
+    
+    for filename, entry in entries.items():
+        if filename.endswith('.svg'):
+            # Skip documents deleted since the scan
+            try:
+                stat = entry.stat()
                 doc_info = {
                     'filename': filename,
                     'name': filename.replace('.svg', ''),
-                    'created': datetime.fromtimestamp(os.path.getctime(file_path)).isoformat(),
-                    'size': os.path.getsize(file_path)
+                    'created': stat.st_ctime,  # epoch seconds; the viewer formats it
+                    'size': stat.st_size
                 }
                 
                 # Add metadata if available
-                if os.path.exists(metadata_path):
-                    try:
-                        with open(metadata_path, 'r') as f:
-                            metadata = json.load(f)
-                            doc_info.update({
-                                'total_pages': metadata.get('total_pages', 1),
-                                'total_lines': metadata.get('total_lines', 0),
-                                'timestamp': metadata.get('timestamp')
-                            })
-                    except:
-                        pass
-                
-                documents.append(doc_info)
+                metadata_entry = entries.get(filename.replace('.svg', '_metadata.json'))
+                if metadata_entry is not None:
+                    doc_info.update(_document_metadata_summary(metadata_entry))
+            except OSError:
+                continue
+            
+            yield doc_info
+
+@app.route('/api/documents/stream')
+def api_stream_documents():
+    """Stream the document list as NDJSON, one document per line, unsorted"""
+    output_dir = 'output'
+    if not os.path.exists(output_dir):
+        return Response('', mimetype='application/x-ndjson')
+    
+    return Response(
+        (json.dumps(doc_info) + '\n' for doc_info in _iter_documents(output_dir)),
+        mimetype='application/x-ndjson'
+    )
+
+@app.route('/api/documents')
+def api_list_documents():
+    """List all generated documents"""
+    try:
+        output_dir = 'output'
+        if not os.path.exists(output_dir):
+            return jsonify({'documents': []})
         
         # Sort by creation date, newest first
-        documents.sort(key=lambda x: x['created'], reverse=True)
+        documents = sorted(_iter_documents(output_dir), key=lambda x: x['created'], reverse=True)
         
         return jsonify({'documents': documents})
         
@@ -1038,37 +1239,39 @@ def api_get_svg(filename):
     """Get SVG content for viewing"""
     try:
         file_path = os.path.join('output', filename)
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                svg_content = f.read()
-            return jsonify({'svg_content': svg_content})
-        else:
-            return jsonify({'error': 'File not found'}), 404
+        # Streamed with an ETag, so an unchanged document is answered with a 304
+        response = send_file(file_path, mimetype='image/svg+xml', conditional=True, etag=True)
+        # Re-synthesizing under the same name overwrites the file, so always revalidate
+        response.cache_control.no_cache = True
+        return response
+    except (FileNotFoundError, IsADirectoryError):
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/output/<filename>')
 def serve_output_file(filename):
     """Serve files from output directory"""
-    return send_from_directory('output', filename)
+    response = send_from_directory('output', filename, conditional=True, etag=True)
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/api/download/<filename>')
 def api_download(filename):
     try:
         file_path = os.path.join('output', filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
-            return jsonify({'error': 'File not found'}), 404
+        return send_file(file_path, as_attachment=True)
+    except (FileNotFoundError, IsADirectoryError):
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def run_web_app(checkpoint_dir='checkpoints', host='127.0.0.1', port=5000, debug=False):
+def run_web_app(checkpoint_dir='checkpoints', host='127.0.0.1', port=5000, debug=False, use_xla=False):
     """Run the Flask web application"""
     global synthesizer
     
     print("Initializing handwriting synthesizer...")
-    synthesizer = AdvancedHandwritingSynthesizer(checkpoint_dir)
+    synthesizer = AdvancedHandwritingSynthesizer(checkpoint_dir, use_xla=use_xla)
     
     # Create directories
     os.makedirs('templates', exist_ok=True)
@@ -1076,7 +1279,12 @@ def run_web_app(checkpoint_dir='checkpoints', host='127.0.0.1', port=5000, debug
     
     print(f"Starting web server on http://{host}:{port}")
     print(f"Document viewer available at http://{host}:{port}/viewer")
-    socketio.run(app, host=host, port=port, debug=debug)
+    try:
+        socketio.run(app, host=host, port=port, debug=debug)
+    finally:
+        # Stop queued synthesis before the engine it runs on is closed
+        synthesis_pool.shutdown(wait=True, cancel_futures=True)
+        synthesizer.close()
 
 if __name__ == "__main__":
     import argparse
@@ -1088,23 +1296,26 @@ if __name__ == "__main__":
     parser.add_argument("--input", help="Input markup file")
     parser.add_argument("--output", help="Output filename")
     parser.add_argument("--checkpoint-dir", default="checkpoints", help="Model checkpoint directory")
+    parser.add_argument("--xla", action="store_true", help="Compile the sampler with XLA")
     
     args = parser.parse_args()
     
     if args.web:
-        run_web_app(args.checkpoint_dir, args.host, args.port)
+        run_web_app(args.checkpoint_dir, args.host, args.port, use_xla=args.xla)
     elif args.input:
-        synthesizer = AdvancedHandwritingSynthesizer(args.checkpoint_dir)
+        synthesizer = AdvancedHandwritingSynthesizer(args.checkpoint_dir, use_xla=args.xla)
         
-        with open(args.input, 'r', encoding='utf-8') as f:
-            markup_text = f.read()
-        
-        result = synthesizer.synthesize_document_with_markup(
-            markup_text=markup_text,
-            output_filename=args.output
-        )
-        
-        print(f"Document generated: {result['svg_filename']}")
-        synthesizer.handwriting_engine.close()
+        try:
+            with open(args.input, 'r', encoding='utf-8') as f:
+                markup_text = f.read()
+            
+            result = synthesizer.synthesize_document_with_markup(
+                markup_text=markup_text,
+                output_filename=args.output
+            )
+            
+            print(f"Document generated: {result['svg_filename']}")
+        finally:
+            synthesizer.close()
     else:
         print("Use --web for web interface or --input for CLI processing")
\ No newline at end of file
@@ -204,6 +204,11 @@ class rnn(TFBaseModel):
             lambda: self.primed_sample(cell),
             lambda: self.sample(cell)
         )
+        # sampling pads finished sequences with zero rows, so each sample's length
+        # is the position of its last nonzero row
+        nonzero = tf.reduce_any(tf.not_equal(self.sampled_sequence, 0.0), axis=2)
+        steps = tf.range(1, tf.shape(nonzero)[1] + 1)
+        self.sampled_lengths = tf.reduce_max(tf.cast(nonzero, tf.int32) * steps, axis=1)
         return self.loss
 
 
@@ -8,22 +8,21 @@ def plot_strokes(strokes, title="Handwriting Prime Data"):
     [x_offset, y_offset, end_of_stroke_flag]
     """
     # Calculate absolute coordinates by taking the cumulative sum of the offsets
-    points = np.cumsum(strokes[:, :2], axis=0)
+    points = np.cumsum(strokes[:, :2], axis=0, dtype=np.float64)
 
     # Find the indices where the pen was lifted
-    # We add 1 to split the array *after* the pen lift point
+    # We add 1 to break the line *after* the pen lift point
     pen_lift_indices = np.where(strokes[:, 2] == 1)[0] + 1
 
-    # Split the points array into a list of continuous strokes
-    stroke_list = np.split(points, pen_lift_indices)
+    # Matplotlib leaves a gap at NaN points, so a NaN row after each pen lift
+    # turns all continuous strokes into one polyline
+    polyline = np.insert(points, pen_lift_indices, np.nan, axis=0)
 
     # --- Plotting ---
     fig, ax = plt.subplots()
 
-    # Plot each continuous stroke as a separate line
-    for stroke in stroke_list:
-        if stroke.shape[0] > 0: # Ensure the stroke segment is not empty
-            ax.plot(stroke[:, 0], stroke[:, 1], 'b-')
+    # Plot every stroke with a single line
+    ax.plot(polyline[:, 0], polyline[:, 1], 'b-')
 
     # Set plot aesthetics for better visualization
     ax.set_title(title)